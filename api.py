@@ -0,0 +1,207 @@
+## BIA calculator HTTP API
+## A lightweight JSON/CSV service for partner sites and payroll tools that runs the same calculations
+## as the Calculator page (policy_engine.py), without a Streamlit session per user.
+## Only uses the standard library. Worker processes are forked after the socket is bound, so they
+## all accept connections on the same port.
+##
+## Usage: python api.py --port 8081 --workers 4
+##
+##   GET  /health
+##   GET  /calculate?income=45000
+##   POST /calculate  {"income": 45000}  or  {"incomes": [45000, 60000]}
+##   POST /calculate  CSV body (Content-Type: text/csv) with an "income" column, returns CSV
+##############################################
+import argparse
+import csv
+import io
+import json
+import os
+import signal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from policy_engine import DEFAULT_POLICY, MAX_INCOME, RESULT_FIELDS, calculate_array
+##############################################
+
+MAX_BATCH = 100_000  ## Largest number of incomes accepted in one request
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _whole_dollars(value):
+    if isinstance(value, str):
+        return int(value.strip())
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise ValueError(value)
+
+
+def parse_incomes(values):
+    """Validate incomes the same way as the calculator's input box: whole, non-negative dollars."""
+    if len(values) > MAX_BATCH:
+        raise RequestError(413, f"At most {MAX_BATCH:,} incomes per request")
+    incomes = []
+    for value in values:
+        try:
+            income = _whole_dollars(value)
+        except ValueError:
+            raise RequestError(400, f"Income {value!r} is not a whole number of dollars")
+        if income < 0:
+            raise RequestError(400, f"Income {value!r} is negative")
+        if income > MAX_INCOME:
+            raise RequestError(400, f"Income {value!r} is more than {MAX_INCOME:,} dollars")
+        incomes.append(income)
+    return np.array(incomes, dtype=np.float64)
+
+
+def calculate_rows(incomes, policy=DEFAULT_POLICY):
+    """The results for each income as a list of dictionaries of whole dollars."""
+    results = calculate_array(incomes, policy)
+    columns = [(name, results[key].astype(np.int64).tolist()) for name, key in RESULT_FIELDS]
+    return [dict(zip([name for name, _ in columns], row)) for row in zip(*[values for _, values in columns])]
+
+
+class CalculationHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  ## Keep connections open between requests
+    disable_nagle_algorithm = True  ## Headers and body go out as separate writes, don't hold the body back
+    quiet = False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif url.path == '/calculate':
+            self._handle(lambda: self._single(parse_qs(url.query).get('income', [''])[0]))
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/calculate':
+            self._send_json(404, {'error': 'Not found'})
+            return
+        self._handle(self._post_calculate)
+
+    def _handle(self, respond):
+        try:
+            respond()
+        except RequestError as error:
+            self._send_json(error.status, {'error': str(error)})
+
+    def _single(self, income):
+        self._send_json(200, calculate_rows(parse_incomes([income]))[0])
+
+    def _post_calculate(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_BODY_BYTES:
+            # The body is left unread, so the connection can't be used for another request
+            self.close_connection = True
+            if length < 0:
+                raise RequestError(400, "Content-Length is not a valid length")
+            raise RequestError(413, "Request body too large")
+        body = self.rfile.read(length)
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip()
+
+        if content_type == 'text/csv':
+            try:
+                text = body.decode('utf-8')
+            except UnicodeDecodeError:
+                raise RequestError(400, "CSV body is not UTF-8 text")
+            reader = csv.DictReader(io.StringIO(text))
+            if 'income' not in (reader.fieldnames or []):
+                raise RequestError(400, "CSV needs an 'income' column")
+            # A short row has no income cell at all (None), which is reported like an empty one
+            rows = calculate_rows(parse_incomes([row['income'] or '' for row in reader]))
+            out = io.StringIO()
+            writer = csv.DictWriter(out, fieldnames=[name for name, _ in RESULT_FIELDS], lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(rows)
+            self._send(200, 'text/csv', out.getvalue().encode('utf-8'))
+            return
+
+        try:
+            request = json.loads(body or b'null')
+        except ValueError:
+            raise RequestError(400, "Body is not valid JSON")
+        if isinstance(request, dict) and 'income' in request:
+            self._single(request['income'])
+        elif isinstance(request, dict) and isinstance(request.get('incomes'), list):
+            self._send_json(200, {'results': calculate_rows(parse_incomes(request['incomes']))})
+        else:
+            raise RequestError(400, 'Expected {"income": ...} or {"incomes": [...]}')
+
+    def _send_json(self, status, payload):
+        self._send(status, 'application/json', json.dumps(payload).encode('utf-8'))
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def serve(host='0.0.0.0', port=8081, workers=1):
+    server = ThreadingHTTPServer((host, port), CalculationHandler)
+    print(f"Serving the BIA calculator API on http://{host}:{port} with {workers} worker(s)")
+    if workers <= 1 or not hasattr(os, 'fork'):
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Pre-fork: every child accepts on the socket the parent already bound
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        stop(None, None)
+    server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the BIA calculator over HTTP")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8081)))
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes (default: one per CPU)")
+    parser.add_argument('--quiet', action='store_true', help="don't log each request")
+    args = parser.parse_args()
+    CalculationHandler.quiet = args.quiet
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
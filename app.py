@@ -8,13 +8,21 @@
 ## Added more information about the latest Henderson Poverty Line data (June quarter 2024) https://melbourneinstitute.unimelb.edu.au/__data/assets/pdf_file/0006/5148069/Poverty-Lines-Australia-June-2024.pdf
 ## Validation: Validated the FY 2024-25 simple tax calculations against the MoneySmart calculator: https://moneysmart.gov.au/work-and-tax/income-tax-calculator 
 ##############################################
-import pandas as pd
-import numpy as np
-import plotly.express as px
 import streamlit as st
-import plotly.graph_objects as go
+import metrics
+from policy_engine import DEFAULT_POLICY
+from payroll_batch import PayrollJob
+from result_cache import cached_figure, cached_income_results, cached_scenario_summary
+from scenarios import IncomeScenario
 ##############################################
 
+## Timing and counters, off unless BIA_METRICS_PORT or BIA_METRICS_FILE is set (see metrics.py)
+metrics.start()
+metrics.record_rerun()
+## Every st.markdown and st.plotly_chart call is timed when metrics are on; when they are off these are just the Streamlit functions
+markdown = metrics.timed('render', st.markdown, element='markdown')
+plotly_chart = metrics.timed('render', st.plotly_chart, element='plotly_chart')  # Mostly serialising the figure
+
 st.set_page_config(layout="centered")
 st.image('BIA logo.png' , width=150)
 st.header("Basic Income Australia's Benefit Calculator")
@@ -35,23 +43,28 @@ with tab1:
         # Meanwhile, hack by using 'st.text_input' and then wrap the output as an integer in the try statement
         input = st.text_input (label = r"$\textsf{\Large What is your annual personal income before tax?}$" , max_chars = 8, placeholder = "Enter income here")
         ## Input quality checks, make sure there are no negative numbers or strings
-        if input.strip():
-            try:
-                # Attempt to convert the input to an integer. PI = personal income
-                pi = int(input)
-
-                # Check if income entered is <0
-                if pi <0:
-                    st.warning("Error: Please enter a non-negative number to the nearest dollar, e.g., 45000")
-                    pi = 88888888  # Set pi to 0 if less than 0
-
-            ## If pi can't be converted to an integer, throw the valid numbers error
-            except ValueError:
-                st.warning("Error: Please enter valid numbers only to the nearest dollar, e.g., 45000")
+        with metrics.span('parse_input'):
+            if input.strip():
+                try:
+                    # Attempt to convert the input to an integer. PI = personal income
+                    pi = int(input)
+
+                    # Check if income entered is <0
+                    if pi <0:
+                        st.warning("Error: Please enter a non-negative number to the nearest dollar, e.g., 45000")
+                        pi = 88888888  # Set pi to 0 if less than 0
+                        metrics.increment('bia_invalid_inputs_total', reason='negative')
+
+                ## If pi can't be converted to an integer, throw the valid numbers error
+                except ValueError:
+                    st.warning("Error: Please enter valid numbers only to the nearest dollar, e.g., 45000")
+                    pi = 88888888
+                    metrics.increment('bia_invalid_inputs_total', reason='not_a_number')
+            ## If nothing has been entered, use 0 as a placeholder to prevent errors
+            ##else: pi = 0
+            else:
                 pi = 88888888
-        ## If nothing has been entered, use 0 as a placeholder to prevent errors
-        ##else: pi = 0
-        else: pi = 88888888
+                metrics.increment('bia_invalid_inputs_total', reason='empty')
     ## If nothing has been entered, use 0 as a placeholder to prevent errors
     except ValueError:
         pi = 0
@@ -69,64 +82,45 @@ code {
 """
 
 # Displays for the custom CSS
-st.markdown(custom_css, unsafe_allow_html=True)
-clawback_rate = 0.3226
-threshold_annual = 80600
-
-## Functions
-# Calculate barebones personal income tax for FY 2024-2025
-# https://www.ato.gov.au/tax-rates-and-codes/tax-rates-australian-residents
-def tax_payable(pi):
-    tax=0
-    if ((pi > 0) and (pi <= 18200)):
-            tax = 0
-    elif ((pi >= 18201) and (pi <= 45000)):
-            tax = (pi - 18200) * 0.16
-    elif ((pi >= 45001) and (pi <= 135000)):
-            tax = ((pi - 45000) * 0.30) + 4288
-    elif ((pi >= 135001) and (pi <= 190000)):
-            tax = ((pi - 135000) * 0.37) + 31288
-    elif pi >= 190001:
-            tax = ((pi - 190000) * 0.45) + 51638
-    return(tax)
+markdown(custom_css, unsafe_allow_html=True)
+## The policy settings and the tax and clawback functions live in policy_engine.py
+policy = DEFAULT_POLICY
+clawback_rate = policy.clawback_rate
+threshold_annual = policy.threshold_annual
 
 #tax_payable(60000)
 
 ## Set up the outputs at different time levels
 
 ## Basic income payment
-weekly_ubi_level = 500
-annual_ubi = weekly_ubi_level*52
+weekly_ubi_level = policy.weekly_ubi_level
+annual_ubi = policy.annual_ubi
 weekly_ubi = weekly_ubi_level
 fornightly_ubi = weekly_ubi_level*2
 
 ##Basic income clawback level
-clawback_amount = 26000 ## $500 weekly UBI x 52 weeks
+clawback_amount = policy.clawback_amount ## $500 weekly UBI x 52 weeks
+
+## Every result for this income, worked out once and shared across sessions
+with metrics.span('tax_clawback'):
+    results = cached_income_results(pi, policy)
 
 ## Tax payable
-annual_tax_payable = round(tax_payable(pi),0)
-weekly_tax_payable = round((tax_payable(pi))/52,0)
-fortnightly_tax_payable = round((tax_payable(pi))/26,0)
+annual_tax_payable = results['annual_tax_payable']
+weekly_tax_payable = results['weekly_tax_payable']
+fortnightly_tax_payable = results['fortnightly_tax_payable']
 
 ## Gross earned income
-annual_gross_income = round(pi,0)
-weekly_gross_income = round((pi/52),0)
-fortnightly_gross_income = round((pi/26),0)
+annual_gross_income = results['annual_gross_income']
+weekly_gross_income = results['weekly_gross_income']
+fortnightly_gross_income = results['fortnightly_gross_income']
 
 ## Net earned income
-annual_net_income = round(pi-(tax_payable(pi)),0)
-weekly_net_income = round((pi-(tax_payable(pi)))/52,0)
-fortnightly_net_income = round((pi-(tax_payable(pi)))/26,0)
-
-## UBI recovery "clawback" function
-def clawback(annual_gross_income):
-    if (annual_gross_income >= threshold_annual):
-        clawback = clawback_amount
-    elif (annual_gross_income < threshold_annual):
-        clawback = round(annual_gross_income * clawback_rate ,0)
-    return(clawback)
+annual_net_income = results['annual_net_income']
+weekly_net_income = results['weekly_net_income']
+fortnightly_net_income = results['fortnightly_net_income']
 
-net_ubi_benefit = clawback_amount - clawback(annual_gross_income) 
+net_ubi_benefit = results['net_ubi_benefit']
 
 def ubi_recovery_explainer(annual_gross_income):
     if (annual_gross_income >= threshold_annual):
@@ -135,7 +129,7 @@ def ubi_recovery_explainer(annual_gross_income):
         explainer = ""+ str(round(annual_gross_income,0)) + " x 32.26%"   
     return(explainer)
     
-net_benefit = annual_net_income + net_ubi_benefit
+net_benefit = results['net_benefit']
 
 ## Default always-on result explainer
 def net_benefit_explainer_brief(annual_gross_income):
@@ -174,130 +168,10 @@ def net_benefit_explainer_detailed(annual_gross_income):
 with tab2:
 ## Policy overview page
 
-    ### PREPARE DATA MODEL FOR CHARTING ### 
-    ## Create the tax and UBI payable data model for chart
-    income_data = list(range(0, 90000, 5000))
-    df = pd.DataFrame({'Gross earned income':income_data})
-    # Include the value 80,600 for treshold data visualisation
-    # Sort the DataFrame by 'Gross earned income'
-    df = df.sort_values(by='Gross earned income').reset_index(drop=True)
-
-    # Apply tax function to calculate 'tax' for each 'Gross earned income'
-    df['Tax'] = df['Gross earned income'].apply(tax_payable)
-    # Calculate net earned income after personal income tax
-    df['Net earned income'] = df['Gross earned income'] - df['Tax']
-
-    # Create 'UBI Benefit' column based on conditions
-    df['UBI Benefit'] = clawback_amount-df['Gross earned income'].apply(lambda x: x * clawback_rate if x < threshold_annual else clawback_amount)
-    df['Net final income'] = df['Net earned income'] + df['UBI Benefit']
-    
-
-    # Extra UBI benefit calculation for the UBI Benefit chart hover functionality later
-    ubi_benefit_hover_list = [clawback_amount - x * clawback_rate if x < threshold_annual else clawback_amount for x in df['Gross earned income']]
-
-    ### START BUILDING THE PLOTLY CHARTS ###
-    fig = go.Figure()
-
-    ## Net earned income view
-    fig.add_trace(go.Bar(
-        x = df['Gross earned income'],
-        y = df['Net earned income'],
-        name = 'Net earned income <br>(Gross income less 2024/25 <br> personal income tax, no UBI)',
-        marker_color = 'blue',
-        hovertemplate = ## Formatting the hover
-        '<b>Gross earned income</b>: $%{x:,.0f}' +
-        '<br><b>Net earned income</b>: $%{y:,.0f}<extra></extra>', 
-        
-    ))
-
-    ## Net final income view
-    fig.add_trace(go.Bar(
-        x = df['Gross earned income'],
-        y = df['Net final income'],
-        name = 'Net final income <br> (Net earned income <br>plus UBI)',
-        marker_color = 'orange',
-        hovertemplate = ## Formatting the hover
-        '<b>Gross earned income</b>: $%{x:,.0f}' +
-        '<br><b>Net final income</b>: $%{y:,.0f}<extra></extra>',
-        
-    ))
-
-    ## UBI Benefit amount view
-    fig.add_trace(go.Bar(
-        x = df['Gross earned income'],
-        y = df['UBI Benefit'],
-        name = 'UBI <br> (Calculated at &#36;26K less 32.26&#37; <br> of gross earned income)',
-        marker_color = 'green',
-        base=df['Net earned income'],
-        hovertemplate = ## Formatting the hover
-        '<b>The calculated UBI entitlement</b>: $%{customdata:,.0f}<extra></extra>',
-        customdata= ubi_benefit_hover_list
-
-    ))
-
-    ## Call out annotations on the chart
-    fig.add_annotation(x= 0, y=31000,
-    text="<b>Creating the income floor</b><br>If the individual receives <br> no employment income, they <br>  then receive the full UBI of  &#36;26k ",
-    xanchor = "left", ## left/right for the annotation
-    yanchor = "bottom", ## up/down for the annotation
-    arrowhead = 0,
-    arrowside = "end", ## arrow direction
-    arrowcolor = "gray",
-    ax = 8, ##arrow angle
-    ay = -70, ##arrow length
-    yshift=-3, ##text up and down
-    bgcolor="rgb(255, 255, 240)", ##pale yellow colour
-    showarrow=True,
-    
-        )
-
-    fig.add_annotation(x= 80600, y=69500, ## the y axis is just for annotation height
-    text="<b> Medium to high earners unaffected</b><br>When gross earned income reaches $80,600, <br> the UBI is completely clawed back",
-    xanchor = "right",
-    arrowside = "end",
-    arrowhead = 0,
-    arrowcolor = "gray",
-    ay = -15, ##arrow angle
-    bgcolor="rgb(255, 255, 240)", ##pale yellow colour
-    showarrow=True,
-        )
-
-    ## Figure formatting
-    fig.update_layout(title='Annual UBI Income Effects', 
-        title_y=0.95, ## Shift title position up and down
-        title_x=0.03, ## Shift title position left and right
-        barmode='group',
-        xaxis_title='<b>Gross employment earned income &#36;', 
-        yaxis_title = '<b>Income &#36; </b>',
-        legend=dict(x=0.01, y=1.20, orientation='h', font=dict(size=13)), ## Format the legend position on the chart
-        xaxis=dict(
-            tickmode='linear',
-            tick0=0,
-            dtick=5000,
-            tickfont=dict(size=14), ## font tick size
-            range=[-2000,87000], ##negative a thousand so that 0K doesn't get chopped off on the chart
-            title_font=dict(size=16),
-            tickangle=-45
-            ),
-
-        yaxis=dict(
-            tickmode='linear',
-            dtick=20000,
-            range=[0,86000],
-            tickfont=dict(size=14),
-            title_font=dict(size=16)
-            ),
-        
-        margin=dict(l=90, r=30, t=100, b=80), ## Padding of the overal plot
-        hoverlabel=dict(font_size=16), ## Hover font size
-        title_font=dict(size=23), ## Title font size
-        plot_bgcolor='rgb(255, 255, 240)', ## Pale yellow colour
-        paper_bgcolor = 'rgb(255, 255, 240)', ## Pale yellow colour
+    ## The chart doesn't depend on the user's income, so it is built once per set of policy settings (see policy_chart.py)
+    with metrics.span('figure'):
+        fig = cached_figure(policy)
 
-        )
-    
-    fig.update_annotations(font_size=14)
-    
     ### CHARTING ENDS ###
 
     ### BLURB BEGINS ###
@@ -305,7 +179,7 @@ with tab2:
     st.write("The BIA policy recovers (or 'taxes') the UBI payment at 32.26 percent of an individual's gross salary up to &#36;80,600 which is approximately 1.1 times the median wage². The 32.26 percent clawback rate was chosen as it represents the dollar amount of annual UBI paid to an individual out of the &#36;80,600 per year threshold (32.26% = &#36;26,000/&#36;80,600).")
     st.write("This means a &#36;80,600 per annum salary is the threshold at which an individual ceases to be a net beneficiary. Hover your mouse on the chart below to explore the policy structure.")
     ## Fang in the chart
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(fig, use_container_width=True)
 
     st.write("If you earn more than &#36;80,600 a year, it means you will still receive the regular UBI payment like everyone else however the full UBI payment (&#36;26K) will be recovered after the fact through the tax system.")
     st.write("If on any week your taxable income drops below &#36;1,550 you become a net UBI beneficiary on a sliding scale. This means the more you earn, the higher the UBI tax you pay and the lower the proportion of the $500/week UBI you will receive. The less you earn, the less UBI tax you pay and the more of the UBI payment you get to keep to meet your basic needs. If you receive zero income in a year, you get to keep the full UBI amount (&#36;500 per week or &#36;26K per year).")
@@ -315,8 +189,8 @@ with tab2:
     st.write("For more details visit BIA's [policy page](https://basicincomeaustralia.com/policy/).")
     
     
-    st.markdown("""<span style='font-size: 11px;'>¹[Melbourne Institute: Applied Economic & Social Research, Poverty Lines Australia - June Quarter 2024.](https://melbourneinstitute.unimelb.edu.au/publications/poverty-lines)</span>""", unsafe_allow_html=True)
-    st.markdown("""<span style='font-size: 11px;'>²[ABS - Employee earnings, reference period August 2024.](https://www.abs.gov.au/statistics/labour/earnings-and-working-conditions/employee-earnings/latest-release) <br> The 1.1 times figure is derived by annualising the &#36;1,396 weekly 'median employee earnings in main job' statistic from the ABS. </span>""", unsafe_allow_html=True)
+    markdown("""<span style='font-size: 11px;'>¹[Melbourne Institute: Applied Economic & Social Research, Poverty Lines Australia - June Quarter 2024.](https://melbourneinstitute.unimelb.edu.au/publications/poverty-lines)</span>""", unsafe_allow_html=True)
+    markdown("""<span style='font-size: 11px;'>²[ABS - Employee earnings, reference period August 2024.](https://www.abs.gov.au/statistics/labour/earnings-and-working-conditions/employee-earnings/latest-release) <br> The 1.1 times figure is derived by annualising the &#36;1,396 weekly 'median employee earnings in main job' statistic from the ABS. </span>""", unsafe_allow_html=True)
 
 ## CALCULATOR PAGE ##
 with tab1:
@@ -336,7 +210,7 @@ with tab1:
     if pi == 88888888:
         pass
     else:
-        st.markdown(netbenexpbrief, unsafe_allow_html=True)
+        markdown(netbenexpbrief, unsafe_allow_html=True)
  
     ## Detailed results
     if pi == 88888888:
@@ -344,7 +218,7 @@ with tab1:
 
     else:
     # Padding
-        st.markdown("<br>", unsafe_allow_html=True)
+        markdown("<br>", unsafe_allow_html=True)
         with st.expander("See calculation"):
         
             col1, col2 = st.columns(2)
@@ -360,10 +234,10 @@ with tab1:
                 st.write("Annual gross income:" , pi )
                 st.write("Annual tax payable:" , int(annual_tax_payable) , "or" , round((annual_tax_payable/max(1,pi))*100,1) , "percent of your income")
                 ## preparing the clawback and recovery results for the markdown formatting so that the result formats look consistent
-                clawback_result = int(clawback(annual_gross_income))
+                clawback_result = int(results['clawback'])
                 recovery_explainer_result = ubi_recovery_explainer(annual_gross_income)
-                st.markdown("UBI recovery amount: " + f"  <code>{clawback_result}</code>"+"(" + f"  <code>{recovery_explainer_result}</code>" + ")" , unsafe_allow_html=True)
-                st.write("Net UBI:" ,  int(net_ubi_benefit) , "(" , int(clawback_amount), "-" , int(clawback(annual_gross_income)) ,")")
+                markdown("UBI recovery amount: " + f"  <code>{clawback_result}</code>"+"(" + f"  <code>{recovery_explainer_result}</code>" + ")" , unsafe_allow_html=True)
+                st.write("Net UBI:" ,  int(net_ubi_benefit) , "(" , int(clawback_amount), "-" , clawback_result ,")")
                 st.write("Annual net take home pay + net UBI:" , int(net_benefit), "(" , annual_net_income , "+" , net_ubi_benefit, ")")
                 netbenexpdetail = net_benefit_explainer_detailed(annual_gross_income)
                     ## Create a border
@@ -373,13 +247,75 @@ with tab1:
                 "</div>"
                 )
 
-                st.markdown(netbenexpdetail, unsafe_allow_html=True)
+                markdown(netbenexpdetail, unsafe_allow_html=True)
             
             ## Padding
-            st.markdown("<br>", unsafe_allow_html=True)
-            st.markdown(""" <span style="font-size: 8pt;">1. Tax calculations are based on the ATO 2024-2025 personal income tax schedule: https://www.ato.gov.au/rates/individual-income-tax-rates/</span>""", unsafe_allow_html=True)
-            st.markdown(""" <span style="font-size: 8pt;">2. Please note this calculator does not cover any HECS-HELP repayments, Medicare levy, Medicare levy surcharge, working holiday makers' tax obligations nor the First Home Super Saver (FHSS) scheme. It simply models the latest Australian personal income tax structure assuming you were a full-year resident for tax purposes.</span>""", unsafe_allow_html=True)
-            st.markdown(""" <span style="font-size: 8pt;">3. <i>Current personal income taxation regime (no UBI)</i> results have been validated against [Moneysmart.gov.au's income tax calculator for FY 2024-2025.](https://moneysmart.gov.au/work-and-tax/income-tax-calculator) </span>""", unsafe_allow_html=True)
+            markdown("<br>", unsafe_allow_html=True)
+            markdown(""" <span style="font-size: 8pt;">1. Tax calculations are based on the ATO 2024-2025 personal income tax schedule: https://www.ato.gov.au/rates/individual-income-tax-rates/</span>""", unsafe_allow_html=True)
+            markdown(""" <span style="font-size: 8pt;">2. Please note this calculator does not cover any HECS-HELP repayments, Medicare levy, Medicare levy surcharge, working holiday makers' tax obligations nor the First Home Super Saver (FHSS) scheme. It simply models the latest Australian personal income tax structure assuming you were a full-year resident for tax purposes.</span>""", unsafe_allow_html=True)
+            markdown(""" <span style="font-size: 8pt;">3. <i>Current personal income taxation regime (no UBI)</i> results have been validated against [Moneysmart.gov.au's income tax calculator for FY 2024-2025.](https://moneysmart.gov.au/work-and-tax/income-tax-calculator) </span>""", unsafe_allow_html=True)
+
+    ## Income volatility - the same average income, earned unevenly over the year
+    markdown("<br>", unsafe_allow_html=True)
+    with st.expander("If your income goes up and down"):
+        st.write("The UBI is recovered from each week's earnings, so people with the same yearly income can keep different amounts of UBI if their weeks of work or hours change over the year. This works out the range of net UBI over 100,000 possible years of weekly earnings that average your annual income.")
+        scenario_weeks = st.slider("Weeks without work in a typical year", 0, 40, 0)
+        scenario_spell = st.slider("Average length of a spell without work (weeks)", 1, 26, 4)
+        scenario_variation = st.slider("How much your weekly hours vary while working (%)", 0, 100, 0)
+
+        if pi == 88888888:
+            st.write("Enter your annual income above to see the range of net UBI you could expect.")
+        elif scenario_weeks == 0 and scenario_variation == 0:
+            # Steady earnings every week: the answer is the calculation above, so there is nothing to sample
+            st.write("With the same earnings every week your net UBI is" , int(results['net_ubi_benefit']) , "per year, as above. Move the sliders to see how a less even income changes it.")
+        else:
+            # Only sampled once a slider is moved, so a new income on its own costs no more than the calculation above
+            try:
+                scenario = cached_scenario_summary(IncomeScenario(pi, scenario_weeks, scenario_spell, scenario_variation / 100), policy)
+            except ValueError as error:
+                st.warning("Error: " + str(error) + ". Please try longer spells or fewer weeks without work.")
+            else:
+                st.write("Expected net UBI:" , int(round(scenario['expected_net_ubi'], 0)) , "per year (compared with" , int(scenario['fixed_income_net_ubi']) , "if your income were the same every week)")
+                st.write("In 9 years out of 10 your net UBI would be between" , int(round(scenario['net_ubi_p5'], 0)) , "and" , int(round(scenario['net_ubi_p95'], 0)))
+                st.write("Spread of net UBI (standard deviation):" , int(round(scenario['net_ubi_std'], 0)))
+                st.write("Expected annual net take home pay + net UBI:" , int(round(scenario['expected_net_final_income'], 0)))
+
+    ## Bulk payroll mode - a whole workforce at once instead of one salary at a time
+    markdown("<br>", unsafe_allow_html=True)
+    with st.expander("Upload a payroll file"):
+        st.write("Upload a CSV file with one row per employee and a column of annual gross incomes. Every row is run through the same calculation as above and you can download the results for each employee.")
+        payroll_income_col = st.text_input("Name of the annual income column", value="income")
+        payroll_file = st.file_uploader("Payroll CSV file", type=["csv"])
+
+        if payroll_file is not None:
+            payroll_job = st.session_state.get("payroll_job")
+            # Only process the file again if it (or the income column) has changed since the last rerun
+            if payroll_job is None or payroll_job.key != (payroll_file.file_id, payroll_income_col, policy):
+                if payroll_job is not None:
+                    payroll_job.cleanup()
+                payroll_job = PayrollJob(payroll_file, payroll_income_col, policy)
+                st.session_state["payroll_job"] = payroll_job
+                progress_bar = st.progress(0.0, text="Processing payroll file...")
+                payroll_job.wait(lambda fraction: progress_bar.progress(fraction, text="Processing payroll file..."))
+                progress_bar.empty()
+
+            try:
+                summary = payroll_job.result()
+            except ValueError as error:
+                st.warning("Error: " + str(error) + ". Please check the income column name.")
+            else:
+                if summary['invalid_rows']:
+                    st.warning("Error: " + '{:,}'.format(summary['invalid_rows']) + " rows did not have a valid income (a non-negative whole number of dollars) and have been left blank in the results")
+                st.write("Employees:" , summary['employees'])
+                st.write("Total annual gross income:" , int(summary['total_gross_income']))
+                st.write("Total annual tax payable:" , int(summary['total_tax']))
+                st.write("Total UBI recovery amount:" , int(summary['total_clawback']))
+                st.write("Total net UBI:" , int(summary['total_net_ubi']))
+                st.write("Employees who are net UBI beneficiaries:" , summary['net_beneficiaries'])
+                if summary['employees']:
+                    st.write("Average net UBI per employee:" , int(round(summary['total_net_ubi'] / summary['employees'], 0)))
+                st.download_button("Download results for each employee", data=payroll_job.open_output,
+                                   file_name="bia_payroll_results.csv", mime="text/csv", on_click="ignore")
 
 ## PROVIDE FEEDBACK PAGE ##
 with tab3:
@@ -413,9 +349,9 @@ with tab3:
     """
 
     # Display the custom CSS
-    st.markdown(custom_css2, unsafe_allow_html=True)
+    markdown(custom_css2, unsafe_allow_html=True)
 
-    st.markdown("""
+    markdown("""
         <h4>Please provide your feedback and ideas for improvements. Examples of other relevant calculators/tools are welcome.</h4>
         <form target="_blank" action="https://formsubmit.co/c2e828e64ff610d01976b3ed3b50ade0" method="POST">
             <div class="form-group">
@@ -432,7 +368,7 @@ with tab3:
 
     """, unsafe_allow_html=True)
 
-st.markdown(""" <span style="font-size: 8pt;">Last updated 29 December 2025 | Calculator prepared by Jessica Chew | [jessicacychew.com](https://jessicacychew.com) | View the code on [GitHub](https://github.com/jessicacychew/bia_policy_model) </span> """, unsafe_allow_html=True)
+markdown(""" <span style="font-size: 8pt;">Last updated 29 December 2025 | Calculator prepared by Jessica Chew | [jessicacychew.com](https://jessicacychew.com) | View the code on [GitHub](https://github.com/jessicacychew/bia_policy_model) </span> """, unsafe_allow_html=True)
 ## next steps (from January 2025 onwards)
 ## Get feedback from people
 ## Do drop downs for weekly / monthly / annual views
@@ -0,0 +1,417 @@
+## BIA benchmark and performance regression suite
+## Times the calculation and rendering paths: the scalar tax and clawback functions, the policy
+## overview chart (data model, figure and serialisation), a full rerun of app.py through Streamlit's
+## AppTest harness, and batch calculation at 10^3 to 10^7 incomes. Each run is appended to a JSON
+## lines history file tagged with the git commit, and compared against a stored baseline: a
+## benchmark that is slower than the baseline by more than the threshold is a regression, and the
+## script exits with status 1.
+##
+## Before timing anything, every fast path (the NumPy arrays, the compiled piecewise curves, the
+## static page's lookup and the result cache) and policy_engine's own scalar functions are checked
+## against a verbatim copy of the calculator's original functions, over random whole-dollar incomes
+## and the bracket edges (18200/18201, 45000/45001, ...).
+##
+## Usage: python benchmark.py                          (check, time, compare with the baseline)
+##        python benchmark.py --threshold 0.25 --only batch
+##        python benchmark.py --save-baseline          (make this run the new baseline)
+##        python benchmark.py --history                (change per commit, from the history file)
+##        python benchmark.py --check                  (differential check only)
+##############################################
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from policy_engine import (DEFAULT_POLICY, calculate, calculate_array, clawback, clawback_array, evaluate,
+                           tax_payable, tax_payable_array)
+##############################################
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(HERE, 'benchmarks')
+HISTORY_PATH = os.path.join(BENCHMARK_DIR, 'history.jsonl')
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'baseline.json')
+DEFAULT_THRESHOLD = 0.20  ## Slower than the baseline by more than this share is a regression
+
+BATCH_SIZES = (10**3, 10**4, 10**5, 10**6, 10**7)
+SCALAR_CALLS = 100_000
+SCALAR_REPEAT = 25  ## The scalar loops are short, and a best of 5 moved by more than the threshold between runs
+APP_RERUNS = 20
+CHECK_INCOMES = 200_000
+
+
+def random_incomes(count, seed=0):
+    """Whole-dollar incomes from a lognormal (median about $60k), with a few zeros, as the app sees them."""
+    rng = np.random.default_rng(seed)
+    incomes = np.round(rng.lognormal(np.log(60000), 0.8, count))
+    incomes[rng.random(count) < 0.05] = 0
+    return incomes
+
+
+def edge_incomes(policy=DEFAULT_POLICY):
+    """Incomes either side of every bracket start and of the clawback threshold."""
+    edges = [b[0] for b in policy.tax_brackets] + [policy.threshold_annual]
+    around = [edge + step for edge in edges for step in (-1, -0.5, 0, 0.5, 1, 2)]
+    return np.array(sorted(set([0, 1, 0.5] + around + [10**7, 99_999_999])), dtype=np.float64)
+
+
+## The calculator's functions as they were in app.py before policy_engine.py, kept verbatim as the
+## reference for the differential check. They only cover whole dollars (the app only accepts whole
+## dollars): an income with cents between two brackets, e.g. 18200.5, falls through to no tax.
+clawback_rate = 0.3226
+threshold_annual = 80600
+clawback_amount = 26000 ## $500 weekly UBI x 52 weeks
+
+
+def _baseline_tax_payable(pi):
+    tax=0
+    if ((pi > 0) and (pi <= 18200)):
+            tax = 0
+    elif ((pi >= 18201) and (pi <= 45000)):
+            tax = (pi - 18200) * 0.16
+    elif ((pi >= 45001) and (pi <= 135000)):
+            tax = ((pi - 45000) * 0.30) + 4288
+    elif ((pi >= 135001) and (pi <= 190000)):
+            tax = ((pi - 135000) * 0.37) + 31288
+    elif pi >= 190001:
+            tax = ((pi - 190000) * 0.45) + 51638
+    return(tax)
+
+
+def _baseline_clawback(annual_gross_income):
+    if (annual_gross_income >= threshold_annual):
+        clawback = clawback_amount
+    elif (annual_gross_income < threshold_annual):
+        clawback = round(annual_gross_income * clawback_rate ,0)
+    return(clawback)
+
+
+def _baseline_results(pi):
+    """The calculator page's results for one income, worked out line for line as the original app.py did."""
+    tax_payable, clawback = _baseline_tax_payable, _baseline_clawback
+    annual_tax_payable = round(tax_payable(pi),0)
+    weekly_tax_payable = round((tax_payable(pi))/52,0)
+    fortnightly_tax_payable = round((tax_payable(pi))/26,0)
+    annual_gross_income = round(pi,0)
+    weekly_gross_income = round((pi/52),0)
+    fortnightly_gross_income = round((pi/26),0)
+    annual_net_income = round(pi-(tax_payable(pi)),0)
+    weekly_net_income = round((pi-(tax_payable(pi)))/52,0)
+    fortnightly_net_income = round((pi-(tax_payable(pi)))/26,0)
+    net_ubi_benefit = clawback_amount - clawback(annual_gross_income)
+    net_benefit = annual_net_income + net_ubi_benefit
+    return {
+        'annual_tax_payable': annual_tax_payable, 'weekly_tax_payable': weekly_tax_payable,
+        'fortnightly_tax_payable': fortnightly_tax_payable, 'annual_gross_income': annual_gross_income,
+        'weekly_gross_income': weekly_gross_income, 'fortnightly_gross_income': fortnightly_gross_income,
+        'annual_net_income': annual_net_income, 'weekly_net_income': weekly_net_income,
+        'fortnightly_net_income': fortnightly_net_income, 'clawback': clawback(annual_gross_income),
+        'net_ubi_benefit': net_ubi_benefit, 'net_benefit': net_benefit,
+    }
+
+
+def _baseline_policy(policy):
+    return (policy.tax_brackets == DEFAULT_POLICY.tax_brackets and policy.clawback_rate == clawback_rate
+            and policy.threshold_annual == threshold_annual and policy.clawback_amount == clawback_amount)
+
+
+## Differential check of the fast paths against the original functions
+def differential_check(count=CHECK_INCOMES, seed=0, policy=DEFAULT_POLICY):
+    """Compare every fast path, and `tax_payable`, `clawback` and `calculate`, with the original functions.
+
+    Uses random whole-dollar incomes and the bracket edges. Incomes with cents, which the original
+    functions don't cover, check the fast paths against policy_engine's scalar functions instead.
+    For policy settings other than the calculator's, policy_engine's scalar functions are the reference.
+    Returns a list of failures as strings (empty if everything matches).
+    """
+    from build_static import build_artifact, evaluate_artifact
+    from piecewise import compile_policy
+    from result_cache import cached_income_results
+
+    rng = np.random.default_rng(seed)
+    edges = edge_incomes(policy)
+    whole = np.concatenate([edges[edges == np.round(edges)], random_incomes(count, seed)])
+    cents = np.round(rng.uniform(0, 300_000, count // 4), 2)
+    failures = []
+
+    def compare(name, got, expected, at, tolerance=0.0):
+        wrong = np.flatnonzero(~(np.abs(np.asarray(got, dtype=np.float64) - expected) <= tolerance))
+        if len(wrong):
+            failures.append(f"{name}: {len(wrong):,} differences, first at ${at[wrong[0]]:,} "
+                            f"({got[wrong[0]]} against {expected[wrong[0]]})")
+
+    def check_fast_paths(label, incomes, expected_tax, expected_clawback):
+        compare(f"tax_payable_array{label}", tax_payable_array(incomes, policy.tax_brackets), expected_tax, incomes)
+        compare(f"clawback_array{label}", clawback_array(incomes, policy.threshold_annual, policy.clawback_rate,
+                                                         policy.clawback_amount), expected_clawback, incomes)
+        results = evaluate(incomes, policy)
+        compare(f"evaluate tax{label}", results['tax'], expected_tax, incomes)
+        compare(f"evaluate net final income{label}", results['net_final_income'],
+                (incomes - expected_tax) + (policy.clawback_amount - expected_clawback), incomes)
+        # The compiled curves are exact for tax; the clawback is left unrounded, so within 50 cents
+        compiled = compile_policy(policy)
+        compare(f"piecewise tax{label}", compiled.tax(incomes), expected_tax, incomes)
+        compare(f"piecewise clawback{label}", compiled.clawback(incomes), expected_clawback, incomes, tolerance=0.5)
+
+    # Whole dollars, as used by the calculator, the batch tools and the static page
+    whole_list = whole.astype(np.int64).tolist()
+    scalar_tax = np.array([tax_payable(pi, policy.tax_brackets) for pi in whole_list])
+    scalar_clawback = np.array([clawback(pi, policy) for pi in whole_list])
+    scalar = [calculate(pi, policy) for pi in whole_list]
+    if _baseline_policy(policy):
+        reference_tax = np.array([_baseline_tax_payable(pi) for pi in whole_list], dtype=np.float64)
+        reference_clawback = np.array([_baseline_clawback(pi) for pi in whole_list], dtype=np.float64)
+        reference = [_baseline_results(pi) for pi in whole_list]
+        compare("tax_payable", scalar_tax, reference_tax, whole)
+        compare("clawback", scalar_clawback, reference_clawback, whole)
+    else:
+        reference_tax, reference_clawback, reference = scalar_tax, scalar_clawback, scalar
+    check_fast_paths("", whole, reference_tax, reference_clawback)
+
+    vector = calculate_array(whole, policy)
+    static = evaluate_artifact(json.loads(json.dumps(build_artifact(policy))), whole)
+    for key in reference[0]:
+        expected = np.array([r[key] for r in reference], dtype=np.float64)
+        compare(f"calculate {key}", np.array([r[key] for r in scalar], dtype=np.float64), expected, whole)
+        if key in vector:
+            compare(f"calculate_array {key}", vector[key], expected, whole)
+        compare(f"static lookup {key}", static[key], expected, whole)
+    for pi in edges[edges == np.round(edges)][::2].astype(np.int64).tolist():
+        if cached_income_results(pi, policy) != calculate(pi, policy):
+            failures.append(f"cached_income_results differs from calculate at ${pi:,}")
+
+    # Incomes with cents: the fast paths agree with policy_engine's scalar functions
+    cents_tax = np.array([tax_payable(pi, policy.tax_brackets) for pi in cents.tolist()])
+    cents_clawback = np.array([clawback(pi, policy) for pi in cents.tolist()])
+    check_fast_paths(" (cents)", cents, cents_tax, cents_clawback)
+    return failures
+
+
+## Benchmarks
+def _best_time(function, repeat):
+    # The best of several runs is the least disturbed by anything else on the machine
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+## Each benchmark is (name, setup, items, repeat): setup() does any preparation and returns the
+## function to time, which handles `items` incomes (or reruns) per call
+def _scalar_benchmarks(policy):
+    incomes = random_incomes(SCALAR_CALLS).tolist()
+    yield 'scalar_tax_payable', lambda: lambda: [tax_payable(pi, policy.tax_brackets) for pi in incomes], len(incomes), SCALAR_REPEAT
+    yield 'scalar_clawback', lambda: lambda: [clawback(pi, policy) for pi in incomes], len(incomes), SCALAR_REPEAT
+    yield 'scalar_calculate', lambda: lambda: [calculate(int(pi), policy) for pi in incomes[:20_000]], 20_000, SCALAR_REPEAT
+
+
+def _chart_benchmarks(policy):
+    def setup(step):
+        import plotly.io as pio
+        from policy_chart import build_figure, chart_model
+        df = chart_model(policy)
+        fig = build_figure(policy, df)
+        return {
+            'model': lambda: chart_model(policy),
+            'figure': lambda: build_figure(policy, df),
+            'serialise': lambda: pio.to_json(fig, validate=False),  ## As st.plotly_chart does
+        }[step]
+    yield 'chart_model', lambda: setup('model'), 1, 5
+    yield 'chart_figure', lambda: setup('figure'), 1, 5
+    yield 'chart_serialise', lambda: setup('serialise'), 1, 5
+
+
+def _app_benchmarks(policy):
+    from streamlit.testing.v1 import AppTest
+    path = os.path.join(HERE, 'app.py')
+    incomes = [str(int(pi)) for pi in random_incomes(APP_RERUNS, seed=1)]
+
+    def first_run():
+        # A new session: the script runs with the modules imported but nothing typed in yet
+        return lambda: AppTest.from_file(path, default_timeout=120).run()
+
+    def reruns():
+        import result_cache
+        app = AppTest.from_file(path, default_timeout=120).run()
+        def rerun():
+            # Emptied before every repeat, so each income is a cache miss as it is for a new visitor,
+            # rather than the later repeats timing nothing but cache hits
+            for name in result_cache.cache_stats():
+                getattr(result_cache, name).clear()
+            for income in incomes:
+                app.text_input[0].input(income).run()
+        return rerun
+    yield 'app_first_run', first_run, 1, 3
+    yield 'app_rerun', reruns, len(incomes), 3
+
+
+def _batch_benchmarks(policy):
+    def setup(size):
+        incomes = random_incomes(size)
+        return lambda: calculate_array(incomes, policy)
+    for size in BATCH_SIZES:
+        yield f'batch_calculate_array_1e{len(str(size)) - 1}', lambda size=size: setup(size), size, 3 if size < 10**7 else 1
+
+
+def run_benchmarks(only=None, policy=DEFAULT_POLICY, report=print):
+    """Time every benchmark whose name matches the regular expression `only`.
+
+    Returns {name: {'seconds': ..., 'items': ..., 'per_second': ...}}, where seconds is the
+    best time for one call over `items` incomes (or reruns).
+    """
+    results = {}
+    for group in (_scalar_benchmarks, _chart_benchmarks, _app_benchmarks, _batch_benchmarks):
+        for name, setup, items, repeat in group(policy):
+            if only and not re.search(only, name):
+                continue
+            seconds = _best_time(setup(), repeat)
+            results[name] = {'seconds': seconds, 'items': items, 'per_second': items / seconds}
+            report(f"  {name:<30}{seconds * 1000:>12.3f} ms{items / seconds:>16,.0f} /s")
+    return results
+
+
+## History and baseline
+def _git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        # Every run appends to the history file, so a change there alone doesn't make the tree dirty
+        history = os.path.relpath(HISTORY_PATH, HERE)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no', '--', '.', f':(exclude){history}'],
+                               cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def make_entry(results):
+    """The results tagged with the commit and the machine they were measured on."""
+    return {
+        'commit': _git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+
+
+def record(results, path=HISTORY_PATH):
+    entry = make_entry(results)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as file:
+        file.write(json.dumps(entry) + '\n')
+    return entry
+
+
+def load_history(path=HISTORY_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(entry, path=BASELINE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(entry, file, indent=1)
+        file.write('\n')
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """(name, seconds, baseline seconds, change) for each benchmark in both, and the names of the regressions.
+
+    change is the relative change in time, e.g. +0.3 is 30% slower and -0.5 twice as fast.
+    """
+    rows, regressions = [], []
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        change = result['seconds'] / before['seconds'] - 1
+        rows.append((name, result['seconds'], before['seconds'], change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def print_history(history):
+    """Each commit's times as a change on the commit before it."""
+    names = sorted({name for entry in history for name in entry['results']})
+    previous = {}
+    for entry in history:
+        print(f"{entry['commit'] or '(no commit)'}  {entry['time']}")
+        for name in names:
+            result = entry['results'].get(name)
+            if result is None:
+                continue
+            change = f"{result['seconds'] / previous[name] - 1:+.1%}" if name in previous else ''
+            print(f"  {name:<30}{result['seconds'] * 1000:>12.3f} ms  {change}")
+            previous[name] = result['seconds']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the BIA calculator and check for performance regressions")
+    parser.add_argument('--only', default=None, help="only run benchmarks whose name matches this regular expression")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown against the baseline counted as a regression (default 0.20 = 20%%)")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--no-record', action='store_true', help="don't append this run to the history file")
+    parser.add_argument('--history', action='store_true', help="show the change per commit from the history file")
+    parser.add_argument('--check', action='store_true', help="only run the differential check")
+    args = parser.parse_args()
+
+    if args.history:
+        print_history(load_history())
+        return
+
+    print("Checking the fast paths against the original calculator functions...")
+    failures = differential_check()
+    for failure in failures:
+        print("  FAILED " + failure)
+    if failures:
+        sys.exit(1)
+    print("  All fast paths match")
+    if args.check:
+        return
+
+    print("Timing (best of several runs):")
+    results = run_benchmarks(args.only)
+    entry = make_entry(results) if args.no_record else record(results)
+
+    baseline = load_baseline()
+    if args.save_baseline:
+        save_baseline(entry)
+        print(f"Saved as the baseline in {BASELINE_PATH}")
+        return
+    if baseline is None:
+        print("No baseline yet: run with --save-baseline to store one")
+        return
+
+    rows, regressions = compare(results, baseline, args.threshold)
+    print(f"Against the baseline from commit {baseline.get('commit')} (regression threshold {args.threshold:.0%}):")
+    for name, seconds, before, change in rows:
+        flag = 'REGRESSION' if name in regressions else ('faster' if change < -args.threshold else '')
+        print(f"  {name:<30}{seconds * 1000:>12.3f} ms{before * 1000:>12.3f} ms{change:>+9.1%}  {flag}")
+    if regressions:
+        print(f"{len(regressions)} regression(s): " + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
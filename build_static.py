@@ -0,0 +1,248 @@
+## BIA static calculator build
+## The Calculator page's results are a pure function of one whole-dollar income, so they can be served
+## from a CDN with no Python at all. This writes a compact breakpoint-encoded artifact (the tax brackets
+## and UBI clawback settings every result is built from, a few hundred bytes, plus a gzipped copy)
+## for the static page in static/, which does the lookup in the browser with static/lookup.js.
+##
+## Before anything is written, every dollar from $0 to the ceiling is checked to give exactly the
+## results of the live Python functions: with a NumPy copy of lookup.js reading the artifact, with
+## `policy_engine.calculate` itself around every breakpoint and at a random sample of incomes, and,
+## when Node is installed, with lookup.js itself. The static page sends incomes above the ceiling to
+## the full calculator.
+##
+## Usage: python build_static.py [--ceiling 1000000] [--out static]
+##############################################
+import argparse
+import dataclasses
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+
+import numpy as np
+
+from piecewise import compile_policy
+from policy_engine import DEFAULT_POLICY, calculate, evaluate
+##############################################
+
+ARTIFACT_FORMAT = 'bia-breakpoints-1'
+ARTIFACT_NAME = 'bia_lookup.json'
+DEFAULT_CEILING = 1_000_000
+DEFAULT_OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+LOOKUP_SCRIPT = os.path.join(DEFAULT_OUT, 'lookup.js')
+CHECK_CHUNK = 1_000_000
+SAMPLE_SIZE = 100_000
+
+## The keys of `policy_engine.calculate`, then the values the page's explainers show
+RESULT_KEYS = (
+    'annual_tax_payable', 'weekly_tax_payable', 'fortnightly_tax_payable',
+    'annual_gross_income', 'weekly_gross_income', 'fortnightly_gross_income',
+    'annual_net_income', 'weekly_net_income', 'fortnightly_net_income',
+    'clawback', 'net_ubi_benefit', 'net_benefit',
+    'tax_percent',  ## Annual tax payable as a percentage of income, to one decimal place
+    'net_gain',  ## "Your income would be enhanced by $..." (net benefit less net take home pay)
+    'above_threshold',  ## 1 at or over the threshold, where the whole UBI is recovered
+)
+
+
+class ArtifactMismatch(Exception):
+    pass
+
+
+def build_artifact(policy=DEFAULT_POLICY, ceiling=DEFAULT_CEILING):
+    settings = dataclasses.asdict(policy)
+    settings['tax_brackets'] = [list(bracket) for bracket in policy.tax_brackets]
+    return {
+        'format': ARTIFACT_FORMAT,
+        'ceiling': ceiling,  ## Highest income checked, and served by the static page
+        'policy': settings,
+        'breakpoints': compile_policy(policy).breakpoints().tolist(),  ## For reference, not used by the lookup
+        'fields': list(RESULT_KEYS),
+    }
+
+
+def _round_one_decimal(values):
+    # Python's round(x, 1), as the Calculator page uses for the tax percentage
+    return np.array([round(value, 1) for value in values.tolist()])
+
+
+## What the live Python functions give, for every income at once
+def expected_results(incomes, policy=DEFAULT_POLICY):
+    incomes = np.asarray(incomes, dtype=np.float64)
+    results = evaluate(incomes, policy)
+    tax = results['tax']
+    annual_tax_payable = np.round(tax)
+    annual_net_income = np.round(incomes - tax)
+    net_benefit = annual_net_income + results['net_ubi']
+    return {
+        'annual_tax_payable': annual_tax_payable,
+        'weekly_tax_payable': np.round(tax / 52),
+        'fortnightly_tax_payable': np.round(tax / 26),
+        'annual_gross_income': np.round(incomes),
+        'weekly_gross_income': np.round(incomes / 52),
+        'fortnightly_gross_income': np.round(incomes / 26),
+        'annual_net_income': annual_net_income,
+        'weekly_net_income': np.round((incomes - tax) / 52),
+        'fortnightly_net_income': np.round((incomes - tax) / 26),
+        'clawback': results['clawback'],
+        'net_ubi_benefit': results['net_ubi'],
+        'net_benefit': net_benefit,
+        'tax_percent': _round_one_decimal(annual_tax_payable / np.maximum(1, incomes) * 100),
+        'net_gain': np.round(net_benefit - annual_net_income),
+        'above_threshold': (incomes >= policy.threshold_annual).astype(np.float64),
+    }
+
+
+## What the static page gives: lookup.js, step for step, reading only the artifact
+def evaluate_artifact(artifact, incomes):
+    settings = artifact['policy']
+    pi = np.asarray(incomes, dtype=np.float64)
+    tax = np.zeros_like(pi)
+    for lower, rate, base in settings['tax_brackets']:
+        tax = np.where(pi > lower, base + (pi - lower) * rate, tax)
+    recovered = np.where(pi >= settings['threshold_annual'], settings['clawback_amount'],
+                         np.round(pi * settings['clawback_rate']))
+    annual_net_income = np.round(pi - tax)
+    annual_tax_payable = np.round(tax)
+    net_ubi_benefit = settings['clawback_amount'] - recovered
+    net_benefit = annual_net_income + net_ubi_benefit
+    return {
+        'annual_tax_payable': annual_tax_payable,
+        'weekly_tax_payable': np.round(tax / 52),
+        'fortnightly_tax_payable': np.round(tax / 26),
+        'annual_gross_income': np.round(pi),
+        'weekly_gross_income': np.round(pi / 52),
+        'fortnightly_gross_income': np.round(pi / 26),
+        'annual_net_income': annual_net_income,
+        'weekly_net_income': np.round((pi - tax) / 52),
+        'fortnightly_net_income': np.round((pi - tax) / 26),
+        'clawback': recovered,
+        'net_ubi_benefit': net_ubi_benefit,
+        'net_benefit': net_benefit,
+        'tax_percent': _round_one_decimal(annual_tax_payable / np.maximum(1, pi) * 100),
+        'net_gain': np.round(net_benefit - annual_net_income),
+        'above_threshold': (pi >= settings['threshold_annual']).astype(np.float64),
+    }
+
+
+def _compare(name, got, expected, incomes):
+    for key in RESULT_KEYS:
+        wrong = np.flatnonzero(got[key] != expected[key])
+        if len(wrong):
+            income = int(incomes[wrong[0]])
+            raise ArtifactMismatch(f"{name}: {key} at ${income:,} is {got[key][wrong[0]]}, "
+                                   f"the Python functions give {expected[key][wrong[0]]}")
+
+
+def _check_scalar(policy, ceiling):
+    """The vectorised expected results against `calculate` one income at a time."""
+    edges = np.concatenate([[0, ceiling]] + [np.arange(b - 2, b + 3) for b in compile_policy(policy).breakpoints()])
+    sample = np.random.default_rng(0).integers(0, ceiling + 1, SAMPLE_SIZE)
+    incomes = np.unique(np.clip(np.concatenate([edges, sample]), 0, ceiling)).astype(np.int64)
+    expected = expected_results(incomes, policy)
+    for i, pi in enumerate(incomes.tolist()):
+        results = calculate(pi, policy)
+        results['tax_percent'] = round((results['annual_tax_payable'] / max(1, pi)) * 100, 1)
+        results['net_gain'] = round(results['net_benefit'] - results['annual_net_income'], 0)
+        results['above_threshold'] = float(pi >= policy.threshold_annual)
+        for key in RESULT_KEYS:
+            if results[key] != expected[key][i]:
+                raise ArtifactMismatch(f"calculate: {key} at ${pi:,} is {results[key]}, "
+                                       f"the vectorised check gives {expected[key][i]}")
+    return len(incomes)
+
+
+def _node_digest(artifact_path, ceiling):
+    """SHA-256 of every field for every dollar, as float64, from lookup.js under Node (None without Node)."""
+    node = shutil.which('node')
+    if node is None:
+        return None
+    script = """
+        const fs = require('fs'), crypto = require('crypto');
+        const lookup = require(process.argv[1]);
+        const artifact = JSON.parse(fs.readFileSync(process.argv[2], 'utf8'));
+        const ceiling = Number(process.argv[3]), chunk = Number(process.argv[4]);
+        const hashes = artifact.fields.map(() => crypto.createHash('sha256'));
+        for (let start = 0; start <= ceiling; start += chunk) {
+            const stop = Math.min(ceiling + 1, start + chunk);
+            const columns = artifact.fields.map(() => new Float64Array(stop - start));
+            for (let pi = start; pi < stop; pi++) {
+                const results = lookup.calculate(pi, artifact);
+                artifact.fields.forEach((key, k) => { columns[k][pi - start] = results[key]; });
+            }
+            columns.forEach((column, k) => hashes[k].update(Buffer.from(column.buffer)));
+        }
+        console.log(JSON.stringify(hashes.map((hash) => hash.digest('hex'))));
+    """
+    output = subprocess.run([node, '-e', script, LOOKUP_SCRIPT, artifact_path, str(ceiling), str(CHECK_CHUNK)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def check_artifact(artifact_path, policy=DEFAULT_POLICY):
+    """Check the written artifact gives the live Python results for every dollar up to its ceiling.
+
+    Raises ArtifactMismatch at the first difference. Returns a summary of the checks run.
+    """
+    with open(artifact_path) as file:
+        artifact = json.load(file)
+    ceiling = artifact['ceiling']
+    hashes = {key: hashlib.sha256() for key in RESULT_KEYS}
+    for start in range(0, ceiling + 1, CHECK_CHUNK):
+        incomes = np.arange(start, min(ceiling + 1, start + CHECK_CHUNK), dtype=np.float64)
+        expected = expected_results(incomes, policy)
+        _compare("artifact", evaluate_artifact(artifact, incomes), expected, incomes)
+        for key in RESULT_KEYS:
+            hashes[key].update(np.ascontiguousarray(expected[key], dtype='<f8').tobytes())
+
+    summary = {'dollars': ceiling + 1, 'scalar_incomes': _check_scalar(policy, ceiling), 'node': False}
+    digests = _node_digest(artifact_path, ceiling)
+    if digests is not None:
+        for key, digest in zip(artifact['fields'], digests):
+            if digest != hashes[key].hexdigest():
+                raise ArtifactMismatch(f"lookup.js: {key} differs from the Python functions somewhere up to ${ceiling:,}")
+        summary['node'] = True
+    return summary
+
+
+def build(out=DEFAULT_OUT, policy=DEFAULT_POLICY, ceiling=DEFAULT_CEILING):
+    """Write the artifact (and a gzipped copy) to `out`, only if it passes `check_artifact`."""
+    os.makedirs(out, exist_ok=True)
+    path = os.path.join(out, ARTIFACT_NAME)
+    body = json.dumps(build_artifact(policy, ceiling), separators=(',', ':')).encode('utf-8')
+    # Checked from a side file, so a failed build never replaces a good artifact
+    with open(path + '.tmp', 'wb') as file:
+        file.write(body)
+    try:
+        summary = check_artifact(path + '.tmp', policy)
+    except BaseException:
+        os.remove(path + '.tmp')
+        raise
+    with gzip.open(path + '.gz.tmp', 'wb', compresslevel=9) as file:
+        file.write(body)
+    os.replace(path + '.tmp', path)
+    os.replace(path + '.gz.tmp', path + '.gz')
+    summary.update(path=path, bytes=len(body), gzip_bytes=os.path.getsize(path + '.gz'))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and check the lookup artifact for the static BIA calculator page")
+    parser.add_argument('--ceiling', type=int, default=DEFAULT_CEILING, help="highest income to check and serve statically")
+    parser.add_argument('--out', default=DEFAULT_OUT, help="directory to write the artifact to (default: static/)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = build(args.out, DEFAULT_POLICY, args.ceiling)
+    print(f"Wrote {summary['path']} ({summary['bytes']:,} bytes, {summary['gzip_bytes']:,} gzipped)")
+    print(f"Checked every dollar from $0 to ${args.ceiling:,} against the Python functions, "
+          f"and {summary['scalar_incomes']:,} incomes against calculate() one at a time")
+    print("Checked static/lookup.js under Node" if summary['node'] else "Node not found: static/lookup.js not checked")
+    print(f"Built in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
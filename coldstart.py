@@ -0,0 +1,169 @@
+## BIA cold start measurement
+## Starts the app the way the container does (`streamlit run app.py` with the flags from the Dockerfile)
+## in a new process each time, and reports:
+##   - server start: from launch until /_stcore/health answers
+##   - first render: from launch until the first session's script run has finished
+##   - warm render: a second session on the same server
+##   - resident memory of the server after the two renders (and its peak)
+## Sessions are driven over Streamlit's own websocket protocol, with the messages a browser sends.
+##
+## Usage: python coldstart.py [--repeat 5]
+##        python coldstart.py --app ../before/app.py     (another checkout, e.g. from git worktree add)
+##        python coldstart.py --docker bia-calculator    (the built image, started with docker run)
+##############################################
+import argparse
+import os
+import shlex
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ClientState_pb2 import ClientState
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from websockets.sync.client import connect
+##############################################
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONTAINER_PORT = 8080
+TIMEOUT = 120
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def dockerfile_flags(app_dir):
+    """The `streamlit run` flags from the Dockerfile's CMD, without the port and the script."""
+    try:
+        with open(os.path.join(app_dir, 'Dockerfile')) as file:
+            cmd = [line for line in file if line.startswith('CMD ')][-1]
+    except (OSError, IndexError):
+        return []
+    words = shlex.split(cmd[len('CMD '):])
+    words = words[words.index('run') + 1:] if 'run' in words else []
+    flags = []
+    while words:
+        word = words.pop(0)
+        if word.endswith('.py'):
+            continue
+        value = None if '=' in word or not words or words[0].startswith('--') else words.pop(0)
+        if not word.startswith('--server.port'):
+            flags += [word] if value is None else [word, value]
+    return flags
+
+
+def wait_for_health(base_url, started, timeout=TIMEOUT):
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(base_url + '/_stcore/health', timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except OSError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{base_url} did not become healthy within {timeout}s")
+
+
+def render(base_url, timeout=TIMEOUT):
+    """Open a session and run the script once, as a browser does. Returns (finished at, bytes received)."""
+    received = 0
+    with connect(base_url.replace('http', 'ws', 1) + '/_stcore/stream', subprotocols=['streamlit'],
+                 open_timeout=timeout, max_size=None) as websocket:
+        websocket.send(BackMsg(rerun_script=ClientState(query_string='', page_script_hash='')).SerializeToString())
+        deadline = time.perf_counter() + timeout
+        while True:
+            data = websocket.recv(timeout=max(0.1, deadline - time.perf_counter()))
+            received += len(data)
+            message = ForwardMsg.FromString(data)
+            if message.WhichOneof('type') == 'script_finished':
+                return time.perf_counter(), received
+
+
+def memory_kb(pid):
+    """(resident, peak resident) memory of a process in kB, from /proc."""
+    values = {}
+    with open(f'/proc/{pid}/status') as file:
+        for line in file:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'VmHWM'):
+                values[key] = int(value.split()[0])
+    return values['VmRSS'], values['VmHWM']
+
+
+def _docker_memory_kb(container):
+    usage = subprocess.run(['docker', 'stats', '--no-stream', '--format', '{{.MemUsage}}', container],
+                           capture_output=True, text=True, check=True).stdout.split('/')[0].strip()
+    units = {'KiB': 1, 'MiB': 1024, 'GiB': 1024 ** 2, 'kB': 1, 'MB': 1000, 'GB': 1000 ** 2, 'B': 1 / 1024}
+    for unit, scale in sorted(units.items(), key=lambda item: -len(item[0])):
+        if usage.endswith(unit):
+            return float(usage[:-len(unit)]) * scale, None
+    return None, None
+
+
+def measure_once(app=None, docker_image=None):
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    if docker_image:
+        container = subprocess.run(['docker', 'run', '-d', '--rm', '-p', f'{port}:{CONTAINER_PORT}', docker_image],
+                                   capture_output=True, text=True, check=True).stdout.strip()
+        stop = lambda: subprocess.run(['docker', 'stop', '-t', '1', container], capture_output=True)
+        memory = lambda: _docker_memory_kb(container)
+    else:
+        app_dir = os.path.dirname(os.path.abspath(app))
+        command = [sys.executable, '-m', 'streamlit', 'run', os.path.basename(app), '--server.port', str(port),
+                   '--server.headless', 'true', '--browser.gatherUsageStats', 'false'] + dockerfile_flags(app_dir)
+        process = subprocess.Popen(command, cwd=app_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        stop = lambda: (process.terminate(), process.wait())
+        memory = lambda: memory_kb(process.pid)
+    try:
+        healthy = wait_for_health(base_url, started)
+        first, first_bytes = render(base_url)
+        warm_start = time.perf_counter()
+        warm, _ = render(base_url)
+        rss, peak = memory()
+    finally:
+        stop()
+    return {
+        'server_start': healthy - started,
+        'first_render': first - started,
+        'first_render_after_start': first - healthy,
+        'warm_render': warm - warm_start,
+        'first_render_bytes': first_bytes,
+        'rss_mb': rss / 1024 if rss is not None else None,
+        'peak_rss_mb': peak / 1024 if peak is not None else None,
+    }
+
+
+def measure(app=None, docker_image=None, repeat=5):
+    """Medians over `repeat` fresh starts."""
+    runs = [measure_once(app, docker_image) for _ in range(repeat)]
+    return {key: (statistics.median(run[key] for run in runs) if runs[0][key] is not None else None) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start, time to first render and memory of the BIA app")
+    parser.add_argument('--app', default=os.path.join(HERE, 'app.py'), help="app script to start (default: this checkout)")
+    parser.add_argument('--docker', default=None, metavar='IMAGE', help="start this image with docker run instead")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    result = measure(args.app, args.docker, args.repeat)
+    print(f"Medians over {args.repeat} cold starts of {args.docker or args.app}:")
+    print(f"  Server start (until healthy):   {result['server_start']:.2f}s")
+    print(f"  Time to first render:           {result['first_render']:.2f}s "
+          f"({result['first_render_after_start']:.2f}s after the server was up, {result['first_render_bytes']:,} bytes)")
+    print(f"  Warm render (second session):   {result['warm_render']:.2f}s")
+    if result['rss_mb'] is not None:
+        peak = f" (peak {result['peak_rss_mb']:.0f} MB)" if result['peak_rss_mb'] is not None else ''
+        print(f"  Resident memory after render:   {result['rss_mb']:.0f} MB" + peak)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+## BIA income dataset cache
+## The modelling tools read the same large income files (ATO sample files, ABS distributions) over
+## and over, and parsing the CSV takes most of the run. This converts a file once into two typed
+## columns - int32 whole-dollar incomes and float32 weights - stored as raw little-endian files under
+## a key made from the SHA-256 of the source file and the columns read. Later runs memory-map the
+## columns instead of parsing, and the chunks they hand to a process pool pickle as a file name and
+## offset, so the workers map the same pages of the page cache instead of each being sent a copy.
+##
+## The cache lives in build/datasets (or the directory in BIA_DATASET_CACHE). The modelling tools
+## use it with --cache, or convert a file up front with:
+## Usage: python dataset_cache.py incomes.csv --income-col income --weight-col weight
+##############################################
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import time
+
+import numpy as np
+##############################################
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.environ.get('BIA_DATASET_CACHE') or os.path.join(HERE, 'build', 'datasets')
+FORMAT_VERSION = 1  ## Part of every key, so a change to the layout never reads an old entry
+
+INCOME_DTYPE = np.dtype('<i4')
+WEIGHT_DTYPE = np.dtype('<f4')
+INCOME_FILE = 'income.i4'
+WEIGHT_FILE = 'weight.f4'
+META_FILE = 'meta.json'
+HASH_BLOCK = 1 << 20
+
+
+def file_digest(path):
+    """SHA-256 of the file's contents, as hex."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(digest, income_col='income', weight_col=None):
+    columns = hashlib.sha256(json.dumps([FORMAT_VERSION, income_col, weight_col]).encode()).hexdigest()
+    return f'{digest}-{columns[:16]}'
+
+
+## Memory-mapped columns
+def _map_column(filename, dtype, offset, length):
+    return SharedColumn(filename, dtype=dtype, mode='r', offset=offset, shape=(length,))
+
+
+class SharedColumn(np.memmap):
+    """A read-only memory-mapped slice of a cached column.
+
+    Pickles as its file name, offset and length rather than its data, so sending one to a pool
+    worker is cheap and the worker maps the same pages.
+    """
+
+    def __reduce__(self):
+        if isinstance(self.base, mmap.mmap):
+            return _map_column, (self.filename, self.dtype.str, self.offset, len(self))
+        return super().__reduce__()  # A slice of a slice pickles its data, like any other array
+
+
+class CachedDataset:
+    """One converted income file: `rows` whole-dollar incomes and (if the source had them) weights."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE)) as file:
+            self.meta = json.load(file)
+        self.rows = self.meta['rows']
+        self.weighted = self.meta['weight_col'] is not None
+
+    def _column(self, name, dtype, start, stop):
+        if stop <= start:
+            return np.empty(0, dtype=dtype)  # mmap can't map an empty range
+        return _map_column(os.path.join(self.directory, name), dtype.str, start * dtype.itemsize, stop - start)
+
+    def incomes(self, start=0, stop=None):
+        return self._column(INCOME_FILE, INCOME_DTYPE, start, self.rows if stop is None else stop)
+
+    def weights(self, start=0, stop=None):
+        """Weights for the rows, or ones (as `microsimulation.read_chunks` gives) if the source had no weight column."""
+        stop = self.rows if stop is None else stop
+        if not self.weighted:
+            return np.ones(max(0, stop - start))
+        return self._column(WEIGHT_FILE, WEIGHT_DTYPE, start, stop)
+
+    def chunks(self, chunksize):
+        """Yield (incomes, weights) for at most `chunksize` rows at a time, like `microsimulation.read_chunks`."""
+        for start in range(0, self.rows, chunksize):
+            stop = min(start + chunksize, self.rows)
+            yield self.incomes(start, stop), self.weights(start, stop)
+
+
+## Converting a source file
+def _write_entry(directory, path, income_col, weight_col, digest):
+    from microsimulation import read_chunks
+    rows = rounded = 0
+    with open(os.path.join(directory, INCOME_FILE), 'wb') as income_file, \
+            open(os.path.join(directory, WEIGHT_FILE), 'wb') as weight_file:
+        for incomes, weights in read_chunks(path, income_col, weight_col):
+            whole = np.rint(incomes)
+            if whole.size and (whole.min() < np.iinfo(INCOME_DTYPE).min or whole.max() > np.iinfo(INCOME_DTYPE).max):
+                raise ValueError(f"{path} has incomes outside the range of a 32-bit integer")
+            rounded += int(np.count_nonzero(whole != incomes))
+            whole.astype(INCOME_DTYPE).tofile(income_file)
+            if weight_col is not None:
+                weights.astype(WEIGHT_DTYPE).tofile(weight_file)
+            rows += len(incomes)
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'source': os.path.abspath(path),
+        'source_sha256': digest,
+        'source_bytes': os.path.getsize(path),
+        'income_col': income_col,
+        'weight_col': weight_col,
+        'rows': rows,
+        'rounded_incomes': rounded,  ## Incomes that weren't whole dollars, rounded half to even
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(os.path.join(directory, META_FILE), 'w') as file:
+        json.dump(meta, file, indent=1)
+
+
+def cached_dataset(path, income_col='income', weight_col=None, cache_dir=DEFAULT_CACHE_DIR):
+    """The cached columns for the file, converting it first if it hasn't been seen before."""
+    digest = file_digest(path)
+    directory = os.path.join(cache_dir, cache_key(digest, income_col, weight_col))
+    if not os.path.exists(os.path.join(directory, META_FILE)):
+        # Written to a side directory and renamed into place, so a run that fails part way or a
+        # concurrent conversion of the same file never leaves a half-written entry behind
+        os.makedirs(cache_dir, exist_ok=True)
+        building = f'{directory}.tmp-{os.getpid()}'
+        os.makedirs(building, exist_ok=True)
+        try:
+            _write_entry(building, path, income_col, weight_col, digest)
+            os.rename(building, directory)
+        except OSError:
+            if not os.path.exists(os.path.join(directory, META_FILE)):
+                raise
+        finally:
+            shutil.rmtree(building, ignore_errors=True)
+    return CachedDataset(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert an income file to memory-mapped int32/float32 columns for the modelling tools")
+    parser.add_argument('path', help="CSV or Parquet file with one row per adult (or per weighted group of adults)")
+    parser.add_argument('--income-col', default='income')
+    parser.add_argument('--weight-col', default=None)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dataset = cached_dataset(args.path, args.income_col, args.weight_col, args.cache_dir)
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(os.path.join(dataset.directory, name)) for name in os.listdir(dataset.directory))
+    print(f"Rows:              {dataset.rows:,}")
+    print(f"Cached in:         {dataset.directory} ({size / 1e6:,.1f} MB, source {dataset.meta['source_bytes'] / 1e6:,.1f} MB)")
+    if dataset.meta['rounded_incomes']:
+        print(f"Rounded incomes:   {dataset.meta['rounded_incomes']:,} were not whole dollars")
+    print(f"Ready in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+## BIA distributional analysis
+## Who wins and who loses under the policy: weighted deciles of the net gain, the mean gain in each
+## income decile, the Gini coefficient before and after, and poverty measures against the Henderson
+## Poverty Line. Built on a mergeable streaming quantile sketch, so chunked or parallel runs over
+## very large files are combined without sorting the whole population in memory.
+##
+## Error bounds (sketch mode, relative accuracy a, default 0.5%):
+##   - quantiles are within a relative error of a of the exact weighted quantile
+##   - the Gini coefficient is at most a below the exact value (never above it)
+##   - mean gain by income decile treats people within one sketch bin (incomes within a factor of
+##     (1 + a) / (1 - a) of each other) as interchangeable at a decile boundary
+##   - totals and poverty measures are exact
+## `analyse_exact` computes the same results exactly, for checking.
+##
+## Usage: python distribution.py incomes.csv --weight-col weight [--exact]
+##############################################
+import argparse
+import math
+import time
+
+import numpy as np
+
+from microsimulation import DEFAULT_CHUNKSIZE, map_chunks, read_chunks
+from policy_engine import DEFAULT_POLICY, evaluate
+##############################################
+
+## Single person not in the workforce, June quarter 2024 (Melbourne Institute)
+HENDERSON_POVERTY_LINE_WEEKLY = 496.39
+HENDERSON_POVERTY_LINE_ANNUAL = HENDERSON_POVERTY_LINE_WEEKLY * 52
+
+DECILES = 10
+DEFAULT_RELATIVE_ACCURACY = 0.005
+
+
+class QuantileSketch:
+    """Weighted quantile sketch with relative-error guarantees (in the style of DDSketch).
+
+    Each value goes into a logarithmic bin covering (g^(i-1), g^i] with g = (1 + a) / (1 - a),
+    where a is the relative accuracy. A bin keeps its total weight, weighted value and an
+    optional weighted "tracked" value, so sketches are merged by adding bins.
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._bins = {}  ## key -> [weight, weighted value, weighted tracked value]
+
+    def update(self, values, weights=None, tracked=None):
+        values = np.asarray(values, dtype=np.float64)
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=np.float64)
+        tracked = np.zeros(len(values)) if tracked is None else np.asarray(tracked, dtype=np.float64)
+        sign = np.sign(values).astype(np.int64)
+        magnitude = np.where(sign == 0, 1.0, np.abs(values))
+        index = np.where(sign == 0, 0, np.ceil(np.log(magnitude) / self._log_gamma)).astype(np.int64)
+        # One integer key per (index, sign) pair; key % 3 recovers sign + 1
+        keys, pooled = np.unique(index * 3 + sign + 1, return_inverse=True)
+        sums = np.stack([np.bincount(pooled, weights=w, minlength=len(keys))
+                         for w in (weights, weights * values, weights * tracked)], axis=1)
+        for key, row in zip(keys.tolist(), sums):
+            if key in self._bins:
+                self._bins[key] += row
+            else:
+                self._bins[key] = row.copy()
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Only sketches with the same relative accuracy can be merged")
+        for key, row in other._bins.items():
+            if key in self._bins:
+                self._bins[key] += row
+            else:
+                self._bins[key] = row.copy()
+        return self
+
+    def _sorted_bins(self):
+        """(representative values, weights, weighted values, weighted tracked values), ascending."""
+        if not self._bins:
+            return (np.empty(0),) * 4
+        keys = np.fromiter(self._bins, dtype=np.int64, count=len(self._bins))
+        sign = keys % 3 - 1
+        index = (keys - (sign + 1)) // 3
+        # The value in (g^(i-1), g^i] with the smallest worst-case relative error
+        representative = sign * 2 * self.gamma ** index.astype(np.float64) / (self.gamma + 1)
+        order = np.argsort(representative, kind='stable')
+        sums = np.array([self._bins[key] for key in keys[order].tolist()])
+        return representative[order], sums[:, 0], sums[:, 1], sums[:, 2]
+
+    @property
+    def total_weight(self):
+        return sum(row[0] for row in self._bins.values())
+
+    def quantile(self, q):
+        values, weights, _, _ = self._sorted_bins()
+        cumulative = np.cumsum(weights)
+        position = np.searchsorted(cumulative, np.asarray(q) * cumulative[-1], side='left')
+        return values[np.minimum(position, len(values) - 1)]
+
+    def gini(self):
+        _, weights, weighted_values, _ = self._sorted_bins()
+        return _grouped_gini(weights, weighted_values)
+
+    def tracked_means(self, groups=DECILES):
+        """Mean tracked value in each of `groups` equal-weight groups of the sketched values.
+
+        A bin straddling a group boundary is split in proportion to the weight on each side.
+        """
+        _, weights, _, tracked = self._sorted_bins()
+        cumulative_weight = np.concatenate([[0], np.cumsum(weights)])
+        cumulative_tracked = np.concatenate([[0], np.cumsum(tracked)])
+        edges = np.linspace(0, cumulative_weight[-1], groups + 1)
+        return np.diff(np.interp(edges, cumulative_weight, cumulative_tracked)) / np.diff(edges)
+
+
+def _grouped_gini(weights, weighted_values):
+    # Gini = 1 - sum over groups of population share x (cumulative income share before + after)
+    population_share = weights / weights.sum()
+    cumulative_share = np.concatenate([[0], np.cumsum(weighted_values)]) / weighted_values.sum()
+    return float(1 - np.sum(population_share * (cumulative_share[:-1] + cumulative_share[1:])))
+
+
+def _poverty(incomes, weights, poverty_line):
+    shortfall = np.maximum(poverty_line - incomes, 0)
+    return {'poor': float(weights[shortfall > 0].sum()), 'gap': float(np.dot(shortfall, weights))}
+
+
+class DistributionAccumulator:
+    """Distributional results built up a chunk at a time. Accumulators for separate chunks
+    (e.g. from different worker processes) are combined with `merge`."""
+
+    def __init__(self, policy=DEFAULT_POLICY, relative_accuracy=DEFAULT_RELATIVE_ACCURACY,
+                 poverty_line=HENDERSON_POVERTY_LINE_ANNUAL):
+        self.policy = policy
+        self.poverty_line = poverty_line
+        self.adults = 0.0
+        self.total_gain = 0.0
+        self.gross_income = QuantileSketch(relative_accuracy)  ## Tracks the net gain, for decile means
+        self.net_gain = QuantileSketch(relative_accuracy)
+        self.net_earned_income = QuantileSketch(relative_accuracy)
+        self.net_final_income = QuantileSketch(relative_accuracy)
+        self.poverty_before = {'poor': 0.0, 'gap': 0.0}
+        self.poverty_after = {'poor': 0.0, 'gap': 0.0}
+
+    def update(self, incomes, weights=None):
+        incomes = np.asarray(incomes, dtype=np.float64)
+        weights = np.ones(len(incomes)) if weights is None else np.asarray(weights, dtype=np.float64)
+        results = evaluate(incomes, self.policy)
+        gain = results['net_ubi']
+        self.adults += float(weights.sum())
+        self.total_gain += float(np.dot(gain, weights))
+        self.gross_income.update(incomes, weights, tracked=gain)
+        self.net_gain.update(gain, weights)
+        self.net_earned_income.update(results['net_earned_income'], weights)
+        self.net_final_income.update(results['net_final_income'], weights)
+        for totals, incomes_after_tax in ((self.poverty_before, results['net_earned_income']),
+                                          (self.poverty_after, results['net_final_income'])):
+            for key, value in _poverty(incomes_after_tax, weights, self.poverty_line).items():
+                totals[key] += value
+        return self
+
+    def merge(self, other):
+        self.adults += other.adults
+        self.total_gain += other.total_gain
+        for name in ('gross_income', 'net_gain', 'net_earned_income', 'net_final_income'):
+            getattr(self, name).merge(getattr(other, name))
+        for mine, theirs in ((self.poverty_before, other.poverty_before), (self.poverty_after, other.poverty_after)):
+            for key in mine:
+                mine[key] += theirs[key]
+        return self
+
+    def result(self):
+        return _result(
+            adults=self.adults,
+            total_gain=self.total_gain,
+            net_gain_deciles=self.net_gain.quantile(np.arange(1, DECILES) / DECILES),
+            mean_gain_by_income_decile=self.gross_income.tracked_means(DECILES),
+            gini_before=self.net_earned_income.gini(),
+            gini_after=self.net_final_income.gini(),
+            poverty_before=self.poverty_before,
+            poverty_after=self.poverty_after,
+            poverty_line=self.poverty_line,
+        )
+
+
+def _result(adults, total_gain, net_gain_deciles, mean_gain_by_income_decile, gini_before, gini_after,
+            poverty_before, poverty_after, poverty_line):
+    return {
+        'adults': adults,
+        'mean_gain': total_gain / adults,
+        'net_gain_deciles': np.asarray(net_gain_deciles),  ## 10th, 20th, ... 90th percentiles of the net gain
+        'mean_gain_by_income_decile': np.asarray(mean_gain_by_income_decile),
+        'gini_before': gini_before,  ## Net earned income (no UBI)
+        'gini_after': gini_after,  ## Net final income (with UBI)
+        'poverty_rate_before': poverty_before['poor'] / adults,
+        'poverty_rate_after': poverty_after['poor'] / adults,
+        ## Average shortfall below the poverty line as a share of the line (FGT1 poverty gap index)
+        'poverty_gap_index_before': poverty_before['gap'] / poverty_line / adults,
+        'poverty_gap_index_after': poverty_after['gap'] / poverty_line / adults,
+        'poverty_gap_before': poverty_before['gap'],
+        'poverty_gap_after': poverty_after['gap'],
+    }
+
+
+## Exact mode, for checking the sketches
+def weighted_quantiles(values, weights, q):
+    """Smallest value whose cumulative weight reaches each share q of the total."""
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(weights[order])
+    position = np.searchsorted(cumulative, np.asarray(q) * cumulative[-1], side='left')
+    return values[order][np.minimum(position, len(values) - 1)]
+
+
+def weighted_gini(values, weights):
+    order = np.argsort(values, kind='stable')
+    return _grouped_gini(weights[order], (values * weights)[order])
+
+
+def analyse_exact(incomes, weights=None, policy=DEFAULT_POLICY, poverty_line=HENDERSON_POVERTY_LINE_ANNUAL):
+    """The same results as `DistributionAccumulator`, computed exactly in memory."""
+    incomes = np.asarray(incomes, dtype=np.float64)
+    weights = np.ones(len(incomes)) if weights is None else np.asarray(weights, dtype=np.float64)
+    results = evaluate(incomes, policy)
+    gain = results['net_ubi']
+
+    # Mean gain in each income decile, splitting the weight of anyone on a decile boundary
+    order = np.argsort(incomes, kind='stable')
+    cumulative_weight = np.concatenate([[0], np.cumsum(weights[order])])
+    cumulative_gain = np.concatenate([[0], np.cumsum((gain * weights)[order])])
+    edges = np.linspace(0, cumulative_weight[-1], DECILES + 1)
+    decile_means = np.diff(np.interp(edges, cumulative_weight, cumulative_gain)) / np.diff(edges)
+
+    return _result(
+        adults=float(weights.sum()),
+        total_gain=float(np.dot(gain, weights)),
+        net_gain_deciles=weighted_quantiles(gain, weights, np.arange(1, DECILES) / DECILES),
+        mean_gain_by_income_decile=decile_means,
+        gini_before=weighted_gini(results['net_earned_income'], weights),
+        gini_after=weighted_gini(results['net_final_income'], weights),
+        poverty_before=_poverty(results['net_earned_income'], weights, poverty_line),
+        poverty_after=_poverty(results['net_final_income'], weights, poverty_line),
+        poverty_line=poverty_line,
+    )
+
+
+def _accumulate_chunk(incomes, weights, policy, relative_accuracy):
+    return DistributionAccumulator(policy, relative_accuracy).update(incomes, weights)
+
+
+def analyse_file(path, policy=DEFAULT_POLICY, income_col='income', weight_col=None, chunksize=DEFAULT_CHUNKSIZE,
+                 workers=None, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, cache=False):
+    """Sketch each chunk of the file in the process pool and merge the sketches.
+
+    The file is parsed in this process either way, so more workers only help with `cache`.
+    """
+    total = DistributionAccumulator(policy, relative_accuracy)
+    chunks = read_chunks(path, income_col, weight_col, chunksize, cache)
+    for accumulator in map_chunks(_accumulate_chunk, chunks, (policy, relative_accuracy), workers):
+        total.merge(accumulator)
+    return total.result()
+
+
+def print_result(result):
+    print(f"Adults:                              {result['adults']:,.0f}")
+    print(f"Mean net gain:                       ${result['mean_gain']:,.0f}")
+    print("Net gain deciles (10th-90th):        " + ", ".join(f"${v:,.0f}" for v in result['net_gain_deciles']))
+    print("Mean gain by income decile (1-10):   " + ", ".join(f"${v:,.0f}" for v in result['mean_gain_by_income_decile']))
+    print(f"Gini before / after:                 {result['gini_before']:.4f} / {result['gini_after']:.4f}")
+    print(f"Below poverty line before / after:   {result['poverty_rate_before']:.2%} / {result['poverty_rate_after']:.2%}")
+    print(f"Poverty gap index before / after:    {result['poverty_gap_index_before']:.4f} / {result['poverty_gap_index_after']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distributional analysis of the BIA policy over an income distribution file")
+    parser.add_argument('path', help="CSV or Parquet file with one row per adult (or per weighted group of adults)")
+    parser.add_argument('--income-col', default='income')
+    parser.add_argument('--weight-col', default=None)
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--relative-accuracy', type=float, default=DEFAULT_RELATIVE_ACCURACY)
+    parser.add_argument('--exact', action='store_true', help="also compute exact results in memory and compare")
+    parser.add_argument('--cache', action='store_true', help="read the file through the binary dataset cache (see dataset_cache.py)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = analyse_file(args.path, DEFAULT_POLICY, args.income_col, args.weight_col, args.chunksize,
+                          args.workers, args.relative_accuracy, args.cache)
+    print(f"Sketched in {time.perf_counter() - start:.2f}s")
+    print_result(result)
+
+    if args.exact:
+        chunks = list(read_chunks(args.path, args.income_col, args.weight_col, args.chunksize, args.cache))
+        start = time.perf_counter()
+        exact = analyse_exact(np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks]))
+        print(f"\nExact in {time.perf_counter() - start:.2f}s")
+        print_result(exact)
+
+
+if __name__ == '__main__':
+    main()
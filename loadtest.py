@@ -0,0 +1,78 @@
+## Load test for the BIA calculator HTTP API (api.py)
+## Sends requests from several concurrent clients over keep-alive connections and reports
+## throughput and latency percentiles.
+##
+## Usage: python api.py --port 8081 --quiet &
+##        python loadtest.py --url http://127.0.0.1:8081 --clients 16 --duration 10 --batch 1
+##############################################
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+##############################################
+
+
+def client(url, batch, deadline, latencies, errors, seed):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    headers = {'Content-Type': 'application/json'}
+    while time.perf_counter() < deadline:
+        if batch == 1:
+            body = json.dumps({'income': rng.randint(0, 250000)}).encode()
+        else:
+            body = json.dumps({'incomes': [rng.randint(0, 250000) for _ in range(batch)]}).encode()
+        # Bytes bodies go out in the same packet as the headers
+        start = time.perf_counter()
+        try:
+            connection.request('POST', '/calculate', body, headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as error:
+            errors.append(repr(error))
+            connection.close()
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the BIA calculator API")
+    parser.add_argument('--url', default='http://127.0.0.1:8081')
+    parser.add_argument('--clients', type=int, default=16, help="concurrent connections")
+    parser.add_argument('--duration', type=float, default=10, help="seconds to run for")
+    parser.add_argument('--batch', type=int, default=1, help="incomes per request")
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    latencies, errors = [], []  ## list.append is thread-safe
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=client, args=(url, args.batch, deadline, latencies, errors, seed))
+               for seed in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if not latencies:
+        print(f"No successful requests ({len(errors)} errors)")
+        return
+    latencies_ms = np.array(latencies) * 1000
+    print(f"Requests:        {len(latencies):,} ok, {len(errors):,} errors in {elapsed:.1f}s")
+    print(f"Throughput:      {len(latencies) / elapsed:,.0f} requests/s ({len(latencies) * args.batch / elapsed:,.0f} incomes/s)")
+    print(f"Latency p50:     {np.percentile(latencies_ms, 50):.2f} ms")
+    print(f"Latency p99:     {np.percentile(latencies_ms, 99):.2f} ms")
+    print(f"Latency max:     {latencies_ms.max():.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
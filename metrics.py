@@ -0,0 +1,204 @@
+## BIA app metrics
+## Timing spans and counters for the Streamlit app, exported in the Prometheus text format, so
+## instance sizing and regressions can be read off real traffic. Like result_cache.py, everything
+## lives at module level and is shared by every session in the server process.
+##
+## Off unless switched on with an environment variable:
+##   BIA_METRICS_PORT=9100           serve http://<host>:9100/metrics from a background thread
+##   BIA_METRICS_FILE=bia.prom       rewrite this file every BIA_METRICS_INTERVAL seconds (default 15),
+##                                   e.g. for node_exporter's textfile collector
+## When off, `span` hands back one shared do-nothing context manager, `increment` and `record_rerun`
+## return straight away, and `timed` returns the function it is given unchanged.
+##############################################
+import contextlib
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+##############################################
+
+METRICS_PORT = os.environ.get('BIA_METRICS_PORT')
+METRICS_FILE = os.environ.get('BIA_METRICS_FILE')
+METRICS_INTERVAL = float(os.environ.get('BIA_METRICS_INTERVAL', 15))
+ENABLED = bool(METRICS_PORT or METRICS_FILE)
+
+## Upper bounds of the span histogram buckets, in seconds
+SPAN_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER_HELP = {
+    'bia_reruns_total': "Script runs of app.py",
+    'bia_invalid_inputs_total': "Incomes that could not be calculated, by reason (the 88888888 placeholder path)",
+}
+
+_lock = threading.Lock()
+_counters = {}  ## (name, labels) -> value
+_spans = {}  ## labels -> [count in each bucket, sum of seconds, count]
+_sessions = set()  ## Session ids seen in a rerun, pruned when they end
+_started = False
+_NOT_RECORDING = contextlib.nullcontext()
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _observe(labels, seconds):
+    with _lock:
+        histogram = _spans.get(labels)
+        if histogram is None:
+            histogram = _spans[labels] = [[0] * (len(SPAN_BUCKETS) + 1), 0.0, 0]
+        histogram[0][bisect_left(SPAN_BUCKETS, seconds)] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+
+class _Span:
+    __slots__ = ('labels', 'start')
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _observe(self.labels, time.perf_counter() - self.start)
+        return False
+
+
+def span(name, **labels):
+    """Time the body of a `with` block into bia_span_seconds{span=name, ...}."""
+    if not ENABLED:
+        return _NOT_RECORDING
+    return _Span(_labels(dict(labels, span=name)))
+
+
+def timed(name, function, **labels):
+    """`function`, with every call timed as a span. Just `function` when metrics are off."""
+    if not ENABLED:
+        return function
+    labels = _labels(dict(labels, span=name))
+
+    def timed_function(*args, **kwargs):
+        with _Span(labels):
+            return function(*args, **kwargs)
+    return timed_function
+
+
+def increment(name, amount=1, **labels):
+    if not ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def record_rerun():
+    """Count a script run, and note its session for the active sessions gauge."""
+    if not ENABLED:
+        return
+    increment('bia_reruns_total')
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        with _lock:
+            _sessions.add(ctx.session_id)
+
+
+def _active_sessions():
+    from streamlit import runtime
+    if not runtime.exists():
+        return 0
+    instance = runtime.get_instance()
+    with _lock:
+        _sessions.intersection_update([session for session in _sessions if instance.is_active_session(session)])
+        return len(_sessions)
+
+
+## Prometheus text format
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def render_text():
+    """Every metric in the Prometheus text exposition format."""
+    from result_cache import cache_stats
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        spans = sorted((labels, [list(h[0]), h[1], h[2]]) for labels, h in _spans.items())
+
+    for name, help_text in COUNTER_HELP.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [f'{name}{_format_labels(labels)} {value}' for (counter, labels), value in counters if counter == name]
+
+    lines += ['# HELP bia_active_sessions Browser sessions connected to this server',
+              '# TYPE bia_active_sessions gauge', f'bia_active_sessions {_active_sessions()}']
+
+    caches = cache_stats()
+    for name, key, kind, help_text in (('bia_cache_hits_total', 'hits', 'counter', "Result cache lookups found in the cache"),
+                                       ('bia_cache_misses_total', 'misses', 'counter', "Result cache lookups that had to be computed"),
+                                       ('bia_cache_entries', 'size', 'gauge', "Entries held in each result cache")):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += [f'{name}{{cache="{cache}"}} {stats[key]}' for cache, stats in sorted(caches.items())]
+
+    lines += ['# HELP bia_span_seconds Time spent in each step of a rerun', '# TYPE bia_span_seconds histogram']
+    for labels, (buckets, total, count) in spans:
+        cumulative = 0
+        for bound, bucket in zip(SPAN_BUCKETS + ('+Inf',), buckets):
+            cumulative += bucket
+            lines.append(f'bia_span_seconds_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+        lines.append(f'bia_span_seconds_sum{_format_labels(labels)} {total}')
+        lines.append(f'bia_span_seconds_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+## Exporters
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_file(path):
+    # Written to a side file and swapped in, so a scraper never reads half a file
+    with open(path + '.tmp', 'w') as file:
+        file.write(render_text())
+    os.replace(path + '.tmp', path)
+
+
+def _write_file_forever(path, interval):
+    while True:
+        time.sleep(interval)
+        write_file(path)
+
+
+def start():
+    """Start the configured exporters, once per server process. Does nothing when metrics are off."""
+    global _started
+    if not ENABLED or _started:
+        return
+    with _lock:
+        if _started:
+            return
+        _started = True
+    if METRICS_PORT:
+        server = ThreadingHTTPServer(('0.0.0.0', int(METRICS_PORT)), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='bia-metrics-http', daemon=True).start()
+    if METRICS_FILE:
+        threading.Thread(target=_write_file_forever, args=(METRICS_FILE, METRICS_INTERVAL),
+                         name='bia-metrics-file', daemon=True).start()
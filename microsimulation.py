@@ -0,0 +1,165 @@
+## BIA population cost microsimulation
+## Runs a weighted income distribution (e.g. ABS/ATO percentile tables or a unit record file)
+## through the policy engine and reduces it to the total fiscal cost of the policy.
+## The file is read in fixed-size chunks, so memory stays bounded no matter how big the file is,
+## and the chunks are spread across a process pool. Only the per-chunk work runs in the pool: the
+## file is still parsed in this process and each chunk is pickled to a worker. For a CSV or Parquet
+## file parsing is most of the run, so the pool only pays off with --cache, where the chunks are
+## memory-mapped slices that pickle as a file name and offset (see dataset_cache.py).
+##
+## Usage: python microsimulation.py incomes.csv --income-col income --weight-col weight [--cache]
+##############################################
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from policy_engine import DEFAULT_POLICY, evaluate
+##############################################
+
+DEFAULT_CHUNKSIZE = 1_000_000
+
+TOTAL_KEYS = ('people', 'adults', 'gross_ubi_outlay', 'clawback_revenue', 'net_cost', 'net_beneficiaries')
+
+
+## Reading the input file
+def read_chunks(path, income_col='income', weight_col=None, chunksize=DEFAULT_CHUNKSIZE, cache=False):
+    """Yield (incomes, weights) arrays of at most `chunksize` rows from a CSV or Parquet file.
+
+    Rows without a weight column count as one adult each. A blank, non-numeric or infinite income
+    or weight raises ValueError naming the rows, rather than turning every total into NaN. With
+    `cache`, the file is converted once to int32 incomes and float32 weights (see dataset_cache.py)
+    and the chunks are memory-mapped slices of those columns instead.
+    """
+    if cache:
+        from dataset_cache import cached_dataset
+        yield from cached_dataset(path, income_col, weight_col).chunks(chunksize)
+        return
+    columns = [income_col] if weight_col is None else [income_col, weight_col]
+    if str(path).endswith(('.parquet', '.pq')):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet files needs pyarrow: pip install pyarrow")
+        batches = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns))
+    else:
+        batches = pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+    first_row = 1
+    for chunk in batches:
+        incomes = _numeric_column(chunk, income_col, path, first_row)
+        if weight_col is None:
+            weights = np.ones(len(incomes))
+        else:
+            weights = _numeric_column(chunk, weight_col, path, first_row)
+        first_row += len(chunk)
+        yield incomes, weights
+
+
+def _numeric_column(chunk, column, path, first_row):
+    # Text becomes NaN here so it is reported with the blanks instead of failing inside pandas
+    values = pd.to_numeric(chunk[column], errors='coerce').to_numpy(dtype=np.float64)
+    bad = np.flatnonzero(~np.isfinite(values))
+    if bad.size:
+        rows = f"row {first_row + bad[0]:,} has" if bad.size == 1 else \
+            f"{bad.size:,} rows between rows {first_row + bad[0]:,} and {first_row + bad[-1]:,} have"
+        raise ValueError(f"{path}: {rows} a blank, non-numeric or infinite value in the {column} column "
+                         f"(rows counted from the first data row)")
+    return values
+
+
+## Per-chunk totals
+def simulate_chunk(incomes, weights, policy=DEFAULT_POLICY):
+    """Weighted totals for one chunk of adults. Totals from several chunks are combined by adding them."""
+    results = evaluate(incomes, policy)
+    weights = np.asarray(weights, dtype=np.float64)
+    adults = weights.sum()
+    gross_ubi_outlay = policy.annual_ubi * adults
+    clawback_revenue = np.dot(results['clawback'], weights)
+    return {
+        'people': len(incomes),
+        'adults': adults,
+        'gross_ubi_outlay': gross_ubi_outlay,
+        'clawback_revenue': clawback_revenue,
+        'net_cost': gross_ubi_outlay - clawback_revenue,
+        'net_beneficiaries': weights[results['net_ubi'] > 0].sum(),
+    }
+
+
+def combine_totals(totals, more):
+    return {key: totals[key] + more[key] for key in TOTAL_KEYS}
+
+
+def empty_totals():
+    return {key: 0 for key in TOTAL_KEYS}
+
+
+def map_chunks(function, chunks, args=(), workers=None):
+    """Apply `function(incomes, weights, *args)` to every chunk, in order.
+
+    With more than one worker the chunks go to a process pool. Only a couple of chunks per
+    worker are in flight at once, so the reader never gets far ahead of the pool. The chunks are
+    still read here, so the pool helps when `function` outweighs reading and pickling a chunk,
+    as with the memory-mapped chunks of `read_chunks(cache=True)`.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1:
+        for incomes, weights in chunks:
+            yield function(incomes, weights, *args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for incomes, weights in chunks:
+            pending.append(pool.submit(function, incomes, weights, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        for future in pending:
+            yield future.result()
+
+
+def simulate_population(path, policy=DEFAULT_POLICY, income_col='income', weight_col=None,
+                        chunksize=DEFAULT_CHUNKSIZE, workers=None, cache=False):
+    """Total annual cost of the policy over the weighted adults in `path`.
+
+    Returns a dictionary with the number of rows read, weighted adults, gross UBI outlay,
+    clawback revenue, net cost and weighted number of net beneficiaries.
+    """
+    totals = empty_totals()
+    chunks = read_chunks(path, income_col, weight_col, chunksize, cache)
+    for chunk_totals in map_chunks(simulate_chunk, chunks, (policy,), workers):
+        totals = combine_totals(totals, chunk_totals)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the total annual cost of the BIA policy over an income distribution file")
+    parser.add_argument('path', help="CSV or Parquet file with one row per adult (or per weighted group of adults)")
+    parser.add_argument('--income-col', default='income', help="column holding annual gross income (default: income)")
+    parser.add_argument('--weight-col', default=None, help="column holding the number of adults each row represents (default: 1 per row)")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help="rows read per chunk")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes for the per-chunk work, which is worth it with --cache (default: one per CPU, 1 runs in-process)")
+    parser.add_argument('--cache', action='store_true', help="read the file through the binary dataset cache (see dataset_cache.py)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    totals = simulate_population(args.path, DEFAULT_POLICY, args.income_col, args.weight_col, args.chunksize, args.workers,
+                                 args.cache)
+    elapsed = time.perf_counter() - start
+
+    print(f"Rows read:                 {totals['people']:,}")
+    print(f"Adults:                    {totals['adults']:,.0f}")
+    print(f"Gross UBI outlay:          ${totals['gross_ubi_outlay']:,.0f}")
+    print(f"Clawback revenue:          ${totals['clawback_revenue']:,.0f}")
+    print(f"Net cost:                  ${totals['net_cost']:,.0f}")
+    print(f"Net beneficiaries:         {totals['net_beneficiaries']:,.0f}")
+    print(f"Finished in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
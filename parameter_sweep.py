@@ -0,0 +1,166 @@
+## BIA policy parameter sweep
+## Evaluates every combination of UBI level, threshold, clawback rate and clawback amount
+## against an income distribution. Each block of combinations is broadcast against the whole
+## income array in one NumPy operation (parameters x incomes), and the blocks are spread
+## across a process pool.
+##
+## Usage: python parameter_sweep.py incomes.csv --weekly-ubi 400 500 600 --threshold 70000 80600 --out sweep.csv
+##############################################
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from microsimulation import read_chunks
+from policy_engine import DEFAULT_POLICY, clawback_array
+##############################################
+
+DECILES = 10
+
+## Largest (combinations x incomes) table worked on at once, to keep temporaries to a few hundred MB
+MAX_BLOCK_CELLS = 4_000_000
+
+
+def decile_bounds(sorted_weights):
+    """(start, stop, weights) for each decile of an income-sorted weighted population.
+
+    A decile is the rows start to stop and the weight of each of them that falls in the decile.
+    Someone on a decile boundary has their weight split between the two deciles (as
+    `distribution.analyse_exact` does), so a heavily weighted row never leaves a decile empty.
+    """
+    cumulative = np.concatenate([[0], np.cumsum(sorted_weights)])
+    edges = np.linspace(0, cumulative[-1], DECILES + 1)
+    last_row = max(0, len(sorted_weights) - 1)
+    deciles = []
+    for low, high in zip(edges[:-1], edges[1:]):
+        start = min(int(np.searchsorted(cumulative, low, side='right')) - 1, last_row)
+        stop = max(int(np.searchsorted(cumulative, high, side='left')), start + 1)
+        overlap = np.minimum(cumulative[start + 1:stop + 1], high) - np.maximum(cumulative[start:stop], low)
+        deciles.append((start, stop, np.maximum(overlap, 0)))
+    return deciles
+
+
+def parameter_grid(weekly_ubi_levels, thresholds, clawback_rates=None, clawback_amounts=None):
+    """Every combination of the given settings as a DataFrame, one row per scenario.
+
+    Without clawback amounts the whole annual UBI is recovered (weekly level x 52). Without
+    clawback rates the rate is the clawback amount over the threshold, as in the policy
+    text (32.26% = $26,000/$80,600).
+    """
+    rows = []
+    for weekly, threshold, rate, amount in itertools.product(
+            weekly_ubi_levels, thresholds, clawback_rates or [None], clawback_amounts or [None]):
+        amount = weekly * 52 if amount is None else amount
+        rate = amount / threshold if rate is None else rate
+        rows.append((weekly, threshold, rate, amount))
+    return pd.DataFrame(rows, columns=['weekly_ubi_level', 'threshold_annual', 'clawback_rate', 'clawback_amount'])
+
+
+## Worker state, set once per process so the incomes aren't re-sent with every block
+_incomes = None
+_weights = None
+_deciles = None
+
+
+def _init_worker(incomes, weights, deciles):
+    global _incomes, _weights, _deciles
+    _incomes, _weights, _deciles = incomes, weights, deciles
+
+
+def _sweep_block(weekly_ubi_levels, thresholds, clawback_rates, clawback_amounts):
+    # Parameters as (k, 1) columns broadcast against the (n,) incomes give (k, n) tables
+    net_ubi = clawback_array(_incomes, thresholds[:, None], clawback_rates[:, None], clawback_amounts[:, None])
+    np.subtract(clawback_amounts[:, None], net_ubi, out=net_ubi)
+    clawback_revenue = clawback_amounts * _weights.sum() - net_ubi @ _weights
+    # The incomes are sorted and the net UBI never rises with income, so the net beneficiaries
+    # are the first so many people: count them and look up their total weight
+    beneficiaries = np.count_nonzero(net_ubi > 0, axis=1)
+    return {
+        'net_cost': weekly_ubi_levels * 52 * _weights.sum() - clawback_revenue,
+        'net_beneficiaries': np.concatenate([[0], np.cumsum(_weights)])[beneficiaries],
+        # Weighted mean gain within each decile, (k, 10). Each decile is a slice of the sorted incomes
+        'mean_gain': np.stack([net_ubi[:, start:stop] @ weights / weights.sum()
+                               for start, stop, weights in _deciles], axis=1),
+    }
+
+
+def sweep(incomes, weights=None, grid=None, workers=None):
+    """Evaluate every scenario in `grid` (see `parameter_grid`) against the incomes.
+
+    Returns the grid with extra columns: net cost, weighted net beneficiaries and the weighted
+    mean gain in net income (the net UBI) in each income decile.
+    """
+    incomes = np.asarray(incomes, dtype=np.float64)
+    weights = np.ones(len(incomes)) if weights is None else np.asarray(weights, dtype=np.float64)
+    if grid is None:
+        grid = parameter_grid([DEFAULT_POLICY.weekly_ubi_level], [DEFAULT_POLICY.threshold_annual],
+                              [DEFAULT_POLICY.clawback_rate], [DEFAULT_POLICY.clawback_amount])
+
+    # Everything depends on income alone, so people on the same income are pooled into one
+    # weighted row; np.unique also sorts the incomes, which the decile slices rely on
+    incomes, pooled = np.unique(incomes, return_inverse=True)
+    weights = np.bincount(pooled, weights=weights, minlength=len(incomes))
+    deciles = decile_bounds(weights)
+
+    columns = [grid[name].to_numpy(dtype=np.float64) for name in
+               ('weekly_ubi_level', 'threshold_annual', 'clawback_rate', 'clawback_amount')]
+    block = max(1, MAX_BLOCK_CELLS // max(1, len(incomes)))
+    blocks = [[column[start:start + block] for column in columns] for start in range(0, len(grid), block)]
+
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(blocks) == 1:
+        _init_worker(incomes, weights, deciles)
+        results = [_sweep_block(*b) for b in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(incomes, weights, deciles)) as pool:
+            results = list(pool.map(_sweep_block, *zip(*blocks)))
+
+    table = grid.reset_index(drop=True).copy()
+    table['net_cost'] = np.concatenate([r['net_cost'] for r in results])
+    table['net_beneficiaries'] = np.concatenate([r['net_beneficiaries'] for r in results])
+    mean_gain = np.concatenate([r['mean_gain'] for r in results])
+    for decile in range(DECILES):
+        table[f'mean_gain_decile_{decile + 1}'] = mean_gain[:, decile]
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a grid of BIA policy settings against an income distribution file")
+    parser.add_argument('path', help="CSV or Parquet file with one row per adult (or per weighted group of adults)")
+    parser.add_argument('--income-col', default='income')
+    parser.add_argument('--weight-col', default=None)
+    parser.add_argument('--weekly-ubi', type=float, nargs='+', default=[DEFAULT_POLICY.weekly_ubi_level])
+    parser.add_argument('--threshold', type=float, nargs='+', default=[DEFAULT_POLICY.threshold_annual])
+    parser.add_argument('--clawback-rate', type=float, nargs='+', default=None,
+                        help="default: clawback amount / threshold")
+    parser.add_argument('--clawback-amount', type=float, nargs='+', default=None,
+                        help="default: the whole annual UBI")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default=None, help="write the result table to this CSV file")
+    parser.add_argument('--cache', action='store_true', help="read the file through the binary dataset cache (see dataset_cache.py)")
+    args = parser.parse_args()
+
+    # A sweep needs the whole distribution in memory, so gather the chunks into one array
+    chunks = list(read_chunks(args.path, args.income_col, args.weight_col, cache=args.cache))
+    incomes = np.concatenate([c[0] for c in chunks])
+    weights = np.concatenate([c[1] for c in chunks])
+    grid = parameter_grid(args.weekly_ubi, args.threshold, args.clawback_rate, args.clawback_amount)
+
+    start = time.perf_counter()
+    table = sweep(incomes, weights, grid, args.workers)
+    elapsed = time.perf_counter() - start
+
+    if args.out:
+        table.to_csv(args.out, index=False)
+    else:
+        print(table.to_string(index=False))
+    print(f"{len(table):,} scenarios x {len(incomes):,} incomes in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
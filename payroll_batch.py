@@ -0,0 +1,178 @@
+## Bulk payroll file processing for the Calculator page
+## Streams a CSV of annual incomes through the calculator's results a chunk at a time, writing each
+## chunk straight to a results file, so memory stays flat however many employees the file has.
+## In the app the work runs in a separate worker process, so a large file doesn't hold up the
+## other sessions on the same Streamlit server.
+##
+## Usage: python payroll_batch.py payroll.csv results.csv --income-col income
+##############################################
+import argparse
+import dataclasses
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import weakref
+
+import numpy as np
+
+from policy_engine import DEFAULT_POLICY, MAX_INCOME, RESULT_FIELDS, PolicyParameters, calculate_array
+##############################################
+
+DEFAULT_CHUNKSIZE = 50_000
+
+SUMMARY_KEYS = ('employees', 'invalid_rows', 'total_gross_income', 'total_tax', 'total_clawback',
+                'total_net_ubi', 'net_beneficiaries')
+
+
+def process_payroll(source, destination, income_col='income', chunksize=DEFAULT_CHUNKSIZE,
+                    policy=DEFAULT_POLICY, progress=None):
+    """Copy the CSV `source` to `destination` with the calculator results added to every row.
+
+    Rows whose income the calculator would reject - blank, not a number, negative, not whole
+    dollars or above MAX_INCOME (as `api.parse_incomes` checks) - are kept, with empty results,
+    and counted as invalid. `progress`, if given, is called with the fraction of the file read so
+    far. Returns summary totals over the valid rows.
+    """
+    # Imported here rather than at the top, as the app imports this module for PayrollJob
+    import pandas as pd
+    with open(source, 'rb') as file:
+        size = max(1, os.fstat(file.fileno()).st_size)
+        summary = dict.fromkeys(SUMMARY_KEYS, 0)
+        header = True
+        for chunk in pd.read_csv(file, chunksize=chunksize, dtype=str, keep_default_na=False):
+            if income_col not in chunk.columns:
+                raise ValueError(f"The file has no '{income_col}' column")
+            incomes = pd.to_numeric(chunk[income_col].str.replace(',', '').str.strip(), errors='coerce').to_numpy(dtype=np.float64)
+            with np.errstate(invalid='ignore'):
+                valid = np.isfinite(incomes) & (incomes >= 0) & (incomes <= MAX_INCOME) & (incomes == np.round(incomes))
+            results = calculate_array(np.where(valid, incomes, 0), policy)
+            for name, key in RESULT_FIELDS[1:]:
+                chunk[name] = pd.array(np.where(valid, results[key], np.nan)).astype('Int64')
+
+            summary['employees'] += int(valid.sum())
+            summary['invalid_rows'] += int((~valid).sum())
+            summary['total_gross_income'] += float(incomes[valid].sum())
+            summary['total_tax'] += float(results['annual_tax_payable'][valid].sum())
+            summary['total_clawback'] += float(results['clawback'][valid].sum())
+            summary['total_net_ubi'] += float(results['net_ubi_benefit'][valid].sum())
+            summary['net_beneficiaries'] += int((results['net_ubi_benefit'][valid] > 0).sum())
+
+            chunk.to_csv(destination, mode='w' if header else 'a', header=header, index=False)
+            header = False
+            if progress is not None:
+                progress(min(1.0, file.tell() / size))
+    return summary
+
+
+## Running a file in a worker process
+def _write_file(path, text):
+    # Written to a side file and swapped in, so the app never reads a half-written file
+    with open(path + '.tmp', 'w') as file:
+        file.write(text)
+    os.replace(path + '.tmp', path)
+
+
+class PayrollJob:
+    """One uploaded payroll file being processed by `python payroll_batch.py` in its own process.
+
+    A separate interpreter is used rather than a process pool because Streamlit replaces
+    `__main__` with the app script, which a spawned pool worker would then re-run. The upload
+    is copied to a temporary directory, which is removed by `cleanup` or when the job is
+    garbage collected (e.g. when its session ends).
+    """
+
+    def __init__(self, upload, income_col='income', policy=DEFAULT_POLICY, chunksize=DEFAULT_CHUNKSIZE):
+        self.key = (getattr(upload, 'file_id', None), income_col, policy)
+        self.directory = tempfile.mkdtemp(prefix='bia_payroll_')
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+        self.input_path = os.path.join(self.directory, 'payroll.csv')
+        self.output_path = os.path.join(self.directory, 'bia_payroll_results.csv')
+        self.progress_path = os.path.join(self.directory, 'progress')
+        self.summary_path = os.path.join(self.directory, 'summary.json')
+        with open(self.input_path, 'wb') as file:
+            shutil.copyfileobj(upload, file)
+        self._log = open(os.path.join(self.directory, 'error.log'), 'wb')
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), self.input_path, self.output_path,
+             '--income-col', income_col, '--chunksize', str(chunksize),
+             '--policy', json.dumps(dataclasses.asdict(policy)),
+             '--progress', self.progress_path, '--summary', self.summary_path],
+            stdout=subprocess.DEVNULL, stderr=self._log)
+
+    def progress(self):
+        try:
+            with open(self.progress_path) as file:
+                return float(file.read())
+        except (OSError, ValueError):
+            return 0.0
+
+    def done(self):
+        return self.process.poll() is not None
+
+    def wait(self, on_progress=None, interval=0.25):
+        """Block until the job finishes, calling `on_progress(fraction)` as it goes."""
+        while not self.done():
+            if on_progress is not None:
+                on_progress(self.progress())
+            time.sleep(interval)
+
+    def result(self):
+        """The summary totals from `process_payroll`. Raises ValueError for a bad file."""
+        self.process.wait()
+        self._log.close()
+        try:
+            with open(self.summary_path) as file:
+                summary = json.load(file)
+        except OSError:
+            with open(self._log.name, errors='replace') as log:
+                raise RuntimeError("Processing the payroll file failed:\n" + log.read())
+        if 'error' in summary:
+            raise ValueError(summary['error'])
+        return summary
+
+    def open_output(self):
+        return open(self.output_path, 'rb')
+
+    def cleanup(self):
+        if not self.done():
+            self.process.kill()
+        self._log.close()
+        self._finalizer()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add the BIA calculator results to every row of a payroll CSV file")
+    parser.add_argument('source', help="CSV file with one row per employee")
+    parser.add_argument('destination', help="CSV file to write the results to")
+    parser.add_argument('--income-col', default='income')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--policy', default=None, help="policy settings as JSON (default: the BIA policy)")
+    parser.add_argument('--progress', default=None, help="file to keep the fraction of the input processed in")
+    parser.add_argument('--summary', default=None, help="file to write the summary totals to as JSON")
+    args = parser.parse_args()
+
+    policy = DEFAULT_POLICY
+    if args.policy:
+        settings = json.loads(args.policy)
+        settings['tax_brackets'] = tuple(tuple(bracket) for bracket in settings['tax_brackets'])
+        policy = PolicyParameters(**settings)
+    progress = None
+    if args.progress:
+        progress = lambda fraction: _write_file(args.progress, str(fraction))
+
+    try:
+        summary = process_payroll(args.source, args.destination, args.income_col, args.chunksize, policy, progress)
+    except ValueError as error:
+        summary = {'error': str(error)}
+    if args.summary:
+        _write_file(args.summary, json.dumps(summary))
+    else:
+        print(json.dumps(summary, indent=1))
+
+
+if __name__ == '__main__':
+    main()
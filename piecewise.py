@@ -0,0 +1,164 @@
+## BIA policy as compiled piecewise-linear curves
+## The tax schedule and the 32.26% clawback up to $80,600 are piecewise-linear functions of gross
+## income. Compiling them into explicit breakpoints and slopes means a forward evaluation is one
+## binary search, the effective marginal tax rate (EMTR) curve is exact, and inverse questions
+## ("what gross income gives a net final income of $X?") are answered in closed form.
+##
+## Usage: python piecewise.py                       (print the EMTR schedule)
+##        python piecewise.py --net-final 60000     (gross income needed for a net final income)
+##############################################
+import argparse
+from dataclasses import dataclass
+
+import numpy as np
+
+from policy_engine import DEFAULT_POLICY, TAX_BRACKETS_2024_25
+##############################################
+
+
+class PiecewiseLinear:
+    """f(x) = values[k] + slopes[k] * (x - starts[k]) on [starts[k], starts[k + 1]).
+
+    Segments are closed on the left, so at a jump the function takes the value to the right.
+    Incomes below the first start use the first segment.
+    """
+
+    def __init__(self, starts, values, slopes):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.slopes = np.asarray(slopes, dtype=np.float64)
+
+    @classmethod
+    def identity(cls):
+        return cls([0], [0], [1])
+
+    @classmethod
+    def constant(cls, value):
+        return cls([0], [value], [0])
+
+    def _segment(self, x):
+        return np.maximum(np.searchsorted(self.starts, x, side='right') - 1, 0)
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        k = self._segment(x)
+        return self.values[k] + self.slopes[k] * (x - self.starts[k])
+
+    def slope(self, x):
+        return self.slopes[self._segment(np.asarray(x, dtype=np.float64))]
+
+    def end_values(self):
+        """Value approached at the right end of each segment (infinite for the last one)."""
+        widths = np.append(np.diff(self.starts), np.inf)
+        with np.errstate(invalid='ignore'):
+            ends = self.values + self.slopes * widths
+        # A flat last segment stays at its value rather than 0 * inf
+        ends[-1] = self.values[-1] if self.slopes[-1] == 0 else np.copysign(np.inf, self.slopes[-1])
+        return ends
+
+    def jumps(self):
+        """(income, size) of each discontinuity, e.g. where the clawback switches to the full UBI."""
+        size = self.values[1:] - self.end_values()[:-1]
+        at = np.flatnonzero(size != 0)
+        return list(zip(self.starts[1:][at].tolist(), size[at].tolist()))
+
+    def combine(self, other, scale=1.0):
+        """self + scale * other, on the union of both sets of breakpoints."""
+        starts = np.union1d(self.starts, other.starts)
+        return PiecewiseLinear(starts, self(starts) + scale * other(starts),
+                               self.slope(starts) + scale * other.slope(starts))
+
+    def __add__(self, other):
+        return self.combine(other, 1.0)
+
+    def __sub__(self, other):
+        return self.combine(other, -1.0)
+
+    def inverse(self, y):
+        """Smallest x with f(x) >= y, for a function that never falls within a segment.
+
+        Where f jumps over y the start of the segment after the jump is returned; where f jumps
+        down and takes the value y twice, the lower x is returned.
+        """
+        if np.any(self.slopes < 0):
+            raise ValueError("inverse needs a function that is non-decreasing within each segment")
+        y = np.asarray(y, dtype=np.float64)
+        # First segment whose highest value so far reaches y
+        reached = np.maximum.accumulate(self.end_values())
+        k = np.minimum(np.searchsorted(reached, y, side='left'), len(self.starts) - 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            within = self.starts[k] + (y - self.values[k]) / self.slopes[k]
+        return np.where((self.slopes[k] > 0) & (y > self.values[k]), within, self.starts[k])
+
+
+def compile_tax(tax_brackets=TAX_BRACKETS_2024_25):
+    return PiecewiseLinear([0] + [b[0] for b in tax_brackets],
+                           [0] + [b[2] for b in tax_brackets],
+                           [0] + [b[1] for b in tax_brackets])
+
+
+def compile_clawback(policy=DEFAULT_POLICY):
+    """The clawback before it is rounded to the dollar, so within 50 cents of `policy_engine.clawback`."""
+    return PiecewiseLinear([0, policy.threshold_annual], [0, policy.clawback_amount], [policy.clawback_rate, 0])
+
+
+@dataclass
+class CompiledPolicy:
+    tax: PiecewiseLinear
+    clawback: PiecewiseLinear
+    net_earned_income: PiecewiseLinear
+    net_ubi: PiecewiseLinear
+    net_final_income: PiecewiseLinear
+
+    def breakpoints(self):
+        return self.net_final_income.starts
+
+    def effective_marginal_tax_rate(self, incomes):
+        """Share of the next dollar earned lost to tax and UBI recovery."""
+        return 1 - self.net_final_income.slope(incomes)
+
+    def emtr_schedule(self):
+        """(starts, rates): the EMTR is rates[k] from starts[k] up to starts[k + 1]."""
+        return self.net_final_income.starts, 1 - self.net_final_income.slopes
+
+    def gross_income_for(self, net_final_income):
+        """The lowest gross income that gives at least this net final income."""
+        return self.net_final_income.inverse(net_final_income)
+
+    def gross_income_for_net_earned(self, net_earned_income):
+        """The lowest gross income that gives at least this net earned income (no UBI)."""
+        return self.net_earned_income.inverse(net_earned_income)
+
+
+def compile_policy(policy=DEFAULT_POLICY):
+    tax = compile_tax(policy.tax_brackets)
+    clawback = compile_clawback(policy)
+    net_earned_income = PiecewiseLinear.identity() - tax
+    net_ubi = PiecewiseLinear.constant(policy.clawback_amount) - clawback
+    return CompiledPolicy(tax, clawback, net_earned_income, net_ubi, net_earned_income + net_ubi)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Effective marginal tax rates and inverse queries for the BIA policy")
+    parser.add_argument('--net-final', type=float, nargs='*', default=None,
+                        help="net final incomes to find the gross income for")
+    args = parser.parse_args()
+    compiled = compile_policy(DEFAULT_POLICY)
+
+    if args.net_final:
+        for target, gross in zip(args.net_final, compiled.gross_income_for(args.net_final)):
+            print(f"Net final income ${target:,.2f} needs a gross earned income of ${gross:,.2f}")
+        return
+
+    starts, rates = compiled.emtr_schedule()
+    ends = np.append(starts[1:], np.inf)
+    print("Gross earned income             Effective marginal tax rate")
+    for start, end, rate in zip(starts, ends, rates):
+        span = f"${start:,.0f} - ${end:,.0f}" if np.isfinite(end) else f"${start:,.0f} and over"
+        print(f"{span:<32}{rate:.2%}")
+    for income, size in compiled.net_final_income.jumps():
+        print(f"Net final income jumps by ${size:,.2f} at ${income:,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+## BIA policy overview chart
+## The data model and Plotly figure for the "Annual UBI Income Effects" chart on the Policy overview page.
+## Neither depends on the user's income, so the app builds them once per set of policy settings (see result_cache.py)
+##
+## The policy is evaluated at every dollar up to CHART_MAX_INCOME and the curves are thinned on the
+## server to a few thousand points before they are sent to the browser. The thinning keeps every
+## breakpoint of the tax and clawback rules exactly (see piecewise.py), so the kinks at $18,200,
+## $45,000 and $80,600 are drawn where they are, and the traces use WebGL (Scattergl).
+##
+## To keep the app's cold start short, pandas is only imported when a chart model is built, and the
+## Docker image writes the finished figure to PREBUILT_FIGURE_PATH at build time, which the app
+## loads instead of building it (see result_cache.cached_figure).
+##
+## Usage: python policy_chart.py --report [--html chart_report.html]
+##        (payload size and build/serialise time against the original bar chart, plus a page that
+##         times the browser render of both)
+##        python policy_chart.py --prebuild [PATH]
+##############################################
+import argparse
+import dataclasses
+import gzip
+import hashlib
+import json
+import os
+import time
+import warnings
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from piecewise import compile_policy
+from policy_engine import DEFAULT_POLICY, evaluate
+##############################################
+
+CHART_MAX_INCOME = 250_000  ## Highest gross income on the chart, evaluated in $1 steps
+CHART_POINTS = 1500  ## Points sent per trace after downsampling, not counting the breakpoints
+PREBUILT_FIGURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build', 'policy_chart.json')
+## The code the figure is built from; a prebuilt figure from any other version of these is out of date
+CHART_SOURCES = ('policy_chart.py', 'piecewise.py', 'policy_engine.py')
+
+
+## Shape-preserving downsampling
+def lttb(x, y, points):
+    """Indices of `points` samples of y(x) chosen by Largest-Triangle-Three-Buckets.
+
+    The first and last samples are always kept. Each bucket in between keeps the sample making
+    the largest triangle with the sample kept before it and the mean of the next bucket, which
+    keeps peaks, kinks and steps that plain decimation would skip.
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n) if points >= n else np.array([0, n - 1])[:max(points, 1)]
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i == points - 3:
+            next_x, next_y = x[n - 1], y[n - 1]
+        else:
+            next_x, next_y = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(x, curves, breakpoints, points=CHART_POINTS):
+    """Indices into x that keep every curve's shape, plus each breakpoint and the sample before it.
+
+    Between breakpoints each curve is thinned separately with `lttb`, with samples shared out in
+    proportion to the width of the stretch and between the curves, and the union of the indices
+    is returned, so about `points` samples in all.
+    """
+    at = np.searchsorted(x, breakpoints)
+    at = at[(at > 0) & (at < len(x))]
+    # The sample just before each breakpoint as well, so a jump or kink is drawn at the right income
+    fixed = np.unique(np.concatenate([[0, len(x) - 1], at - 1, at]))
+    keep = [fixed]
+    for start, stop in zip(fixed[:-1], fixed[1:]):
+        share = max(3, int(round(points * (stop - start) / len(x) / len(curves))))
+        if stop - start + 1 <= share:
+            continue
+        for y in curves:
+            keep.append(start + lttb(x[start:stop + 1], y[start:stop + 1], share))
+    return np.unique(np.concatenate(keep))
+
+
+def chart_model(policy=DEFAULT_POLICY, max_income=CHART_MAX_INCOME, points=CHART_POINTS):
+    import pandas as pd
+    ## Create the tax and UBI payable data model for chart, at every dollar
+    income_data = np.arange(0, max_income + 1, dtype=np.float64)
+    results = evaluate(income_data, policy)
+
+    # Only send the browser enough points to draw each curve, always keeping the breakpoints
+    # (tax brackets, and the $80,600 threshold where the UBI is completely clawed back)
+    keep = downsample(income_data,
+                      [results['net_earned_income'], results['net_final_income'], results['net_ubi']],
+                      compile_policy(policy).breakpoints(), points)
+
+    df = pd.DataFrame({'Gross earned income': income_data[keep]})
+    df['Tax'] = results['tax'][keep]
+    # Calculate net earned income after personal income tax
+    df['Net earned income'] = results['net_earned_income'][keep]
+    df['UBI Benefit'] = results['net_ubi'][keep]
+    df['Net final income'] = results['net_final_income'][keep]
+
+    # Extra UBI benefit calculation for the UBI Benefit chart hover functionality later
+    df['UBI hover'] = np.where(df['Gross earned income'] < policy.threshold_annual, df['UBI Benefit'], policy.clawback_amount)
+    return(df)
+
+
+def build_figure(policy=DEFAULT_POLICY, df=None):
+    if df is None:
+        df = chart_model(policy)
+
+    ### START BUILDING THE PLOTLY CHARTS ###
+    fig = go.Figure()
+
+    ## Net earned income view
+    fig.add_trace(go.Scattergl(
+        x = df['Gross earned income'],
+        y = df['Net earned income'],
+        mode = 'lines',
+        name = 'Net earned income <br>(Gross income less 2024/25 <br> personal income tax, no UBI)',
+        line = dict(color='blue', width=3),
+        hovertemplate = ## Formatting the hover
+        '<b>Gross earned income</b>: $%{x:,.0f}' +
+        '<br><b>Net earned income</b>: $%{y:,.0f}<extra></extra>',
+        legendrank = 1,
+    ))
+
+    ## UBI Benefit amount view, shaded between net earned and net final income
+    fig.add_trace(go.Scattergl(
+        x = df['Gross earned income'],
+        y = df['Net final income'],
+        mode = 'lines',
+        fill = 'tonexty',
+        fillcolor = 'rgba(0, 128, 0, 0.45)',
+        line = dict(color='green', width=0),
+        name = 'UBI <br> (Calculated at &#36;26K less 32.26&#37; <br> of gross earned income)',
+        hovertemplate = ## Formatting the hover
+        '<b>The calculated UBI entitlement</b>: $%{customdata:,.0f}<extra></extra>',
+        customdata = df['UBI hover'],
+        legendrank = 3,
+    ))
+
+    ## Net final income view
+    fig.add_trace(go.Scattergl(
+        x = df['Gross earned income'],
+        y = df['Net final income'],
+        mode = 'lines',
+        name = 'Net final income <br> (Net earned income <br>plus UBI)',
+        line = dict(color='orange', width=3),
+        hovertemplate = ## Formatting the hover
+        '<b>Gross earned income</b>: $%{x:,.0f}' +
+        '<br><b>Net final income</b>: $%{y:,.0f}<extra></extra>',
+        legendrank = 2,
+    ))
+
+    _format_figure(fig, policy)
+    return(fig)
+
+
+def bar_chart_model(policy=DEFAULT_POLICY):
+    """The original 18-point model, every $5,000 to $85,000. Kept for comparison (see `report`)."""
+    import pandas as pd
+    ## Create the tax and UBI payable data model for chart
+    income_data = list(range(0, 90000, 5000))
+    df = pd.DataFrame({'Gross earned income':income_data})
+    # Include the value 80,600 for treshold data visualisation
+    # Sort the DataFrame by 'Gross earned income'
+    df = df.sort_values(by='Gross earned income').reset_index(drop=True)
+
+    # Run every 'Gross earned income' through the tax and UBI rules in one pass
+    results = evaluate(df['Gross earned income'].to_numpy(), policy)
+    df['Tax'] = results['tax']
+    # Calculate net earned income after personal income tax
+    df['Net earned income'] = results['net_earned_income']
+    df['UBI Benefit'] = results['net_ubi']
+    df['Net final income'] = results['net_final_income']
+
+    # Extra UBI benefit calculation for the UBI Benefit chart hover functionality later
+    df['UBI hover'] = np.where(df['Gross earned income'] < policy.threshold_annual, results['net_ubi'], policy.clawback_amount)
+    return(df)
+
+
+def build_bar_figure(policy=DEFAULT_POLICY, df=None):
+    """The original grouped bar chart of `bar_chart_model`."""
+    if df is None:
+        df = bar_chart_model(policy)
+
+    ### START BUILDING THE PLOTLY CHARTS ###
+    fig = go.Figure()
+
+    ## Net earned income view
+    fig.add_trace(go.Bar(
+        x = df['Gross earned income'],
+        y = df['Net earned income'],
+        name = 'Net earned income <br>(Gross income less 2024/25 <br> personal income tax, no UBI)',
+        marker_color = 'blue',
+        hovertemplate = ## Formatting the hover
+        '<b>Gross earned income</b>: $%{x:,.0f}' +
+        '<br><b>Net earned income</b>: $%{y:,.0f}<extra></extra>', 
+        
+    ))
+
+    ## Net final income view
+    fig.add_trace(go.Bar(
+        x = df['Gross earned income'],
+        y = df['Net final income'],
+        name = 'Net final income <br> (Net earned income <br>plus UBI)',
+        marker_color = 'orange',
+        hovertemplate = ## Formatting the hover
+        '<b>Gross earned income</b>: $%{x:,.0f}' +
+        '<br><b>Net final income</b>: $%{y:,.0f}<extra></extra>',
+        
+    ))
+
+    ## UBI Benefit amount view
+    fig.add_trace(go.Bar(
+        x = df['Gross earned income'],
+        y = df['UBI Benefit'],
+        name = 'UBI <br> (Calculated at &#36;26K less 32.26&#37; <br> of gross earned income)',
+        marker_color = 'green',
+        base=df['Net earned income'],
+        hovertemplate = ## Formatting the hover
+        '<b>The calculated UBI entitlement</b>: $%{customdata:,.0f}<extra></extra>',
+        customdata= df['UBI hover']
+
+    ))
+
+    _format_figure(fig, policy)
+    return(fig)
+
+
+def _format_figure(fig, policy):
+    ## Call out annotations on the chart
+    fig.add_annotation(x= 0, y=31000,
+    text="<b>Creating the income floor</b><br>If the individual receives <br> no employment income, they <br>  then receive the full UBI of  &#36;26k ",
+    xanchor = "left", ## left/right for the annotation
+    yanchor = "bottom", ## up/down for the annotation
+    arrowhead = 0,
+    arrowside = "end", ## arrow direction
+    arrowcolor = "gray",
+    ax = 8, ##arrow angle
+    ay = -70, ##arrow length
+    yshift=-3, ##text up and down
+    bgcolor="rgb(255, 255, 240)", ##pale yellow colour
+    showarrow=True,
+    
+        )
+
+    fig.add_annotation(x= policy.threshold_annual, y=69500, ## the y axis is just for annotation height
+    text="<b> Medium to high earners unaffected</b><br>When gross earned income reaches $80,600, <br> the UBI is completely clawed back",
+    xanchor = "right",
+    arrowside = "end",
+    arrowhead = 0,
+    arrowcolor = "gray",
+    ay = -15, ##arrow angle
+    bgcolor="rgb(255, 255, 240)", ##pale yellow colour
+    showarrow=True,
+        )
+
+    ## Figure formatting
+    fig.update_layout(title='Annual UBI Income Effects', 
+        title_y=0.95, ## Shift title position up and down
+        title_x=0.03, ## Shift title position left and right
+        barmode='group',
+        xaxis_title='<b>Gross employment earned income &#36;', 
+        yaxis_title = '<b>Income &#36; </b>',
+        legend=dict(x=0.01, y=1.20, orientation='h', font=dict(size=13)), ## Format the legend position on the chart
+        xaxis=dict(
+            tickmode='linear',
+            tick0=0,
+            dtick=5000,
+            tickfont=dict(size=14), ## font tick size
+            range=[-2000,87000], ##negative a thousand so that 0K doesn't get chopped off on the chart
+            title_font=dict(size=16),
+            tickangle=-45
+            ),
+
+        yaxis=dict(
+            tickmode='linear',
+            dtick=20000,
+            range=[0,86000],
+            tickfont=dict(size=14),
+            title_font=dict(size=16)
+            ),
+        
+        margin=dict(l=90, r=30, t=100, b=80), ## Padding of the overal plot
+        hoverlabel=dict(font_size=16), ## Hover font size
+        title_font=dict(size=23), ## Title font size
+        plot_bgcolor='rgb(255, 255, 240)', ## Pale yellow colour
+        paper_bgcolor = 'rgb(255, 255, 240)', ## Pale yellow colour
+
+        )
+    
+    fig.update_annotations(font_size=14)
+
+
+
+## Building the figure ahead of time
+def _policy_settings(policy):
+    # As it comes back from JSON, so a loaded file can be compared with the policy
+    return json.loads(json.dumps(dataclasses.asdict(policy)))
+
+
+def _build_version():
+    """A hash of the chart's source files and the Plotly version, stored with a prebuilt figure."""
+    import plotly
+    digest = hashlib.sha256(plotly.__version__.encode())
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in CHART_SOURCES:
+        with open(os.path.join(here, name), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def prebuild_figure(path=PREBUILT_FIGURE_PATH, policy=DEFAULT_POLICY):
+    """Write the built figure, the policy settings and the code version it was built from, to `path` as JSON."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    figure = json.loads(pio.to_json(build_figure(policy), validate=False))
+    with open(path + '.tmp', 'w') as file:
+        json.dump({'policy': _policy_settings(policy), 'version': _build_version(), 'figure': figure},
+                  file, separators=(',', ':'))
+    os.replace(path + '.tmp', path)
+
+
+def load_prebuilt_figure(policy=DEFAULT_POLICY, path=PREBUILT_FIGURE_PATH):
+    """The figure from `prebuild_figure`, or None if there isn't one for these policy settings and this code."""
+    try:
+        with open(path) as file:
+            prebuilt = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if prebuilt.get('policy') != _policy_settings(policy):
+        return None
+    if prebuilt.get('version') != _build_version():
+        warnings.warn(f"{path} was built from another version of the chart code or Plotly and is ignored; "
+                      "rebuild it with python policy_chart.py --prebuild")
+        return None
+    # The figure was validated when it was built, so skip Plotly's validation of every property,
+    # which takes longer than building it from scratch
+    return go.Figure(prebuilt['figure'], _validate=False)
+
+
+## Comparing the dense chart with the original bar chart
+def _measure(build, repeat=5):
+    build_times, serialise_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fig = build()
+        built = time.perf_counter()
+        # The same serialisation st.plotly_chart does before sending the figure to the browser
+        payload = pio.to_json(fig, validate=False).encode('utf-8')
+        build_times.append(built - start)
+        serialise_times.append(time.perf_counter() - built)
+    return fig, {
+        'points': sum(len(trace.x) for trace in fig.data),
+        'payload_bytes': len(payload),
+        'payload_gzip_bytes': len(gzip.compress(payload)),
+        'build_seconds': min(build_times),
+        'serialise_seconds': min(serialise_times),
+    }
+
+
+def report(policy=DEFAULT_POLICY, html_path=None):
+    """Payload size and server-side build time (best of five) of the bar chart and the dense chart.
+
+    With `html_path`, also writes a self-contained page that renders each figure several times
+    and shows the browser render time (Plotly.newPlot) of both.
+    """
+    figures = {}
+    results = {}
+    for name, build in (('bar', lambda: build_bar_figure(policy)), ('dense', lambda: build_figure(policy))):
+        figures[name], results[name] = _measure(build)
+    if html_path:
+        _write_timing_page(html_path, figures)
+    return results
+
+
+_TIMING_SCRIPT = """
+async function time(name, figure, runs) {
+    const div = document.getElementById(name);
+    const times = [];
+    for (let i = 0; i < runs; i++) {
+        Plotly.purge(div);
+        const start = performance.now();
+        await Plotly.newPlot(div, figure.data, figure.layout);
+        times.push(performance.now() - start);
+    }
+    times.sort((a, b) => a - b);
+    return name + ': median ' + times[Math.floor(runs / 2)].toFixed(1) + ' ms, first ' + times[0].toFixed(1) + ' ms over ' + runs + ' renders';
+}
+(async () => {
+    const lines = [];
+    for (const [name, figure] of Object.entries(FIGURES)) {
+        lines.push(await time(name, figure, 10));
+    }
+    document.getElementById('results').textContent = lines.join('\\n');
+})();
+"""
+
+
+def _write_timing_page(path, figures):
+    from plotly.offline import get_plotlyjs
+    payload = ',\n'.join(f'"{name}": {pio.to_json(fig, validate=False)}' for name, fig in figures.items())
+    with open(path, 'w') as file:
+        file.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Policy chart render times</title>\n')
+        file.write('<script>' + get_plotlyjs() + '</script></head>\n<body>\n<pre id="results">Rendering...</pre>\n')
+        for name in figures:
+            file.write(f'<div id="{name}" style="height:600px"></div>\n')
+        file.write('<script>\nconst FIGURES = {' + payload + '};\n' + _TIMING_SCRIPT + '</script>\n</body></html>\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payload size and render time of the policy overview chart")
+    parser.add_argument('--report', action='store_true', help="compare the dense chart with the original bar chart")
+    parser.add_argument('--html', default=None, help="also write a page that times the browser render of both")
+    parser.add_argument('--prebuild', nargs='?', const=PREBUILT_FIGURE_PATH, default=None, metavar='PATH',
+                        help="write the built figure for the app to load (default: build/policy_chart.json)")
+    args = parser.parse_args()
+    if args.prebuild:
+        prebuild_figure(args.prebuild, DEFAULT_POLICY)
+        print(f"Wrote {args.prebuild}")
+    if not args.report:
+        if not args.prebuild:
+            parser.error("nothing to do: add --report or --prebuild")
+        return
+
+    results = report(DEFAULT_POLICY, args.html)
+    print(f"{'':<14}{'points':>10}{'payload':>14}{'gzipped':>12}{'build':>10}{'serialise':>12}")
+    for name, r in results.items():
+        print(f"{name:<14}{r['points']:>10,}{r['payload_bytes']:>12,} B{r['payload_gzip_bytes']:>10,} B"
+              f"{r['build_seconds'] * 1000:>8.1f}ms{r['serialise_seconds'] * 1000:>10.1f}ms")
+    if args.html:
+        print(f"Open {args.html} in a browser for the render times")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+## BIA policy engine
+## Holds the ATO tax schedule and the BIA UBI settings as data, and evaluates them over
+## whole NumPy arrays of incomes in one pass (rather than one income at a time via .apply)
+##############################################
+from dataclasses import dataclass
+
+import numpy as np
+##############################################
+
+## ATO resident tax rates for FY 2024-2025 (the same rates as the previous financial year)
+## https://www.ato.gov.au/tax-rates-and-codes/tax-rates-australian-residents
+## Each bracket is (income the bracket starts above, marginal rate, tax payable at the start of the bracket)
+## Incomes up to the first bracket (the $18,200 tax-free threshold) pay no tax
+TAX_BRACKETS_2024_25 = (
+    (18200, 0.16, 0),
+    (45000, 0.30, 4288),
+    (135000, 0.37, 31288),
+    (190000, 0.45, 51638),
+)
+
+MAX_INCOME = 10**10  ## Largest income the batch tools accept, well past any real one and exact as a float
+
+
+@dataclass(frozen=True)
+class PolicyParameters:
+    """The settings of the BIA policy. Frozen so a set of parameters can be used as a dictionary key."""
+    weekly_ubi_level: float = 500
+    threshold_annual: float = 80600  ## Gross income at which the whole UBI is recovered
+    clawback_rate: float = 0.3226  ## 32.26% = $26,000/$80,600
+    clawback_amount: float = 26000  ## $500 weekly UBI x 52 weeks
+    tax_brackets: tuple = TAX_BRACKETS_2024_25
+
+    @property
+    def annual_ubi(self):
+        return self.weekly_ubi_level * 52
+
+
+DEFAULT_POLICY = PolicyParameters()
+
+
+## Scalar versions for a single income (used by the calculator page)
+# Calculate barebones personal income tax
+def tax_payable(pi, tax_brackets=TAX_BRACKETS_2024_25):
+    tax = 0
+    for lower, rate, base in tax_brackets:
+        if pi > lower:
+            tax = base + (pi - lower) * rate
+    return(tax)
+
+
+## UBI recovery "clawback" function
+def clawback(annual_gross_income, policy=DEFAULT_POLICY):
+    if (annual_gross_income >= policy.threshold_annual):
+        clawback = policy.clawback_amount
+    else:
+        clawback = round(annual_gross_income * policy.clawback_rate, 0)
+    return(clawback)
+
+
+## Vectorised versions for arrays of incomes
+def _bracket_table(tax_brackets):
+    # Prepend a zero-rate bracket so incomes under the tax-free threshold look up row 0
+    lowers = np.array([0] + [b[0] for b in tax_brackets], dtype=np.float64)
+    rates = np.array([0] + [b[1] for b in tax_brackets], dtype=np.float64)
+    bases = np.array([0] + [b[2] for b in tax_brackets], dtype=np.float64)
+    return lowers, rates, bases
+
+
+def tax_payable_array(incomes, tax_brackets=TAX_BRACKETS_2024_25):
+    incomes = np.asarray(incomes, dtype=np.float64)
+    lowers, rates, bases = _bracket_table(tax_brackets)
+    # Number of bracket starts strictly below each income = the row of the bracket it falls in
+    row = np.searchsorted(lowers[1:], incomes, side='left')
+    return bases[row] + (incomes - lowers[row]) * rates[row]
+
+
+def clawback_array(incomes, threshold_annual, clawback_rate, clawback_amount):
+    # The policy settings broadcast against the incomes, e.g. a (k, 1) column of thresholds
+    # against a (n,) row of incomes gives a (k, n) table of clawbacks
+    incomes = np.asarray(incomes, dtype=np.float64)
+    shape = np.broadcast_shapes(incomes.shape, np.shape(threshold_annual), np.shape(clawback_rate), np.shape(clawback_amount))
+    # Worked in place in one output array, as the tables can be large
+    recovered = np.multiply(incomes, clawback_rate, out=np.empty(shape))
+    np.round(recovered, out=recovered)
+    np.copyto(recovered, clawback_amount, where=incomes >= threshold_annual)
+    return recovered
+
+
+def evaluate(incomes, policy=DEFAULT_POLICY):
+    """Run an array of annual gross incomes through the tax and UBI rules.
+
+    Returns a dictionary of arrays the same shape as `incomes`: tax, net earned income,
+    clawback, net UBI and net final income. Tax is unrounded and clawback is rounded to the
+    dollar, matching `tax_payable` and `clawback`.
+    """
+    incomes = np.asarray(incomes, dtype=np.float64)
+    tax = tax_payable_array(incomes, policy.tax_brackets)
+    recovered = clawback_array(incomes, policy.threshold_annual, policy.clawback_rate, policy.clawback_amount)
+    net_earned_income = incomes - tax
+    net_ubi = policy.clawback_amount - recovered
+    return {
+        'tax': tax,
+        'net_earned_income': net_earned_income,
+        'clawback': recovered,
+        'net_ubi': net_ubi,
+        'net_final_income': net_earned_income + net_ubi,
+    }
+
+
+## All the calculator page's results for one income, working out the tax once
+def calculate(pi, policy=DEFAULT_POLICY):
+    tax = tax_payable(pi, policy.tax_brackets)
+    recovered = clawback(pi, policy)
+    annual_net_income = round(pi - tax, 0)
+    net_ubi_benefit = policy.clawback_amount - recovered
+    return {
+        'annual_tax_payable': round(tax, 0),
+        'weekly_tax_payable': round(tax / 52, 0),
+        'fortnightly_tax_payable': round(tax / 26, 0),
+        'annual_gross_income': round(pi, 0),
+        'weekly_gross_income': round(pi / 52, 0),
+        'fortnightly_gross_income': round(pi / 26, 0),
+        'annual_net_income': annual_net_income,
+        'weekly_net_income': round((pi - tax) / 52, 0),
+        'fortnightly_net_income': round((pi - tax) / 26, 0),
+        'clawback': recovered,
+        'net_ubi_benefit': net_ubi_benefit,
+        'net_benefit': annual_net_income + net_ubi_benefit,
+    }
+
+
+## Output names for the annual results shared by the batch tools, as (output name, key in the results)
+RESULT_FIELDS = (
+    ('income', 'annual_gross_income'),
+    ('tax', 'annual_tax_payable'),
+    ('net_income', 'annual_net_income'),
+    ('clawback', 'clawback'),
+    ('net_ubi', 'net_ubi_benefit'),
+    ('net_benefit', 'net_benefit'),
+)
+
+
+## The calculator page's annual results for an array of incomes, rounded the same way as `calculate`
+def calculate_array(incomes, policy=DEFAULT_POLICY):
+    incomes = np.asarray(incomes, dtype=np.float64)
+    results = evaluate(incomes, policy)
+    annual_net_income = np.round(results['net_earned_income'])
+    return {
+        'annual_gross_income': np.round(incomes),
+        'annual_tax_payable': np.round(results['tax']),
+        'annual_net_income': annual_net_income,
+        'clawback': results['clawback'],
+        'net_ubi_benefit': results['net_ubi'],
+        'net_benefit': annual_net_income + results['net_ubi'],
+    }
@@ -0,0 +1,267 @@
+## BIA policy solver
+## Finds the clawback rate or threshold that gives a target net fiscal cost (0 = budget neutral),
+## instead of working the ratio out by hand (32.26% = $26,000/$80,600).
+## The incomes are pre-binned into a sorted histogram with cumulative sums, so each evaluation of
+## the cost is a binary search over the bins rather than a pass over every person.
+##
+## Usage: python policy_solver.py incomes.csv --weight-col weight --target-cost 0 --solve threshold
+##############################################
+import argparse
+import math
+import time
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+from microsimulation import read_chunks
+from policy_engine import DEFAULT_POLICY
+##############################################
+
+
+@dataclass
+class IncomeHistogram:
+    """Weighted incomes pooled into bins, sorted by income, with running totals."""
+    incomes: np.ndarray  ## Weighted mean income of each bin, ascending
+    cum_weights: np.ndarray  ## Adults in the bins before bin i (length bins + 1)
+    cum_income: np.ndarray  ## Weighted income in the bins before bin i (length bins + 1)
+
+    @classmethod
+    def from_chunks(cls, chunks, bin_width=1):
+        """Build from (incomes, weights) chunks, e.g. `microsimulation.read_chunks`, a chunk at a time.
+
+        Raises ValueError on a NaN or infinite income or weight, which would otherwise sort into a
+        bin above every threshold and quietly skew the cost.
+        """
+        keys, weights, weighted_income = [], [], []
+        first_row = 1
+        for chunk_incomes, chunk_weights in chunks:
+            for name, values in (('income', chunk_incomes), ('weight', chunk_weights)):
+                bad = np.flatnonzero(~np.isfinite(values))
+                if bad.size:
+                    raise ValueError(f"The {name} is NaN or infinite in {bad.size:,} rows, the first being row {first_row + bad[0]:,}")
+            first_row += len(chunk_incomes)
+            chunk_keys, pooled = np.unique(np.floor(chunk_incomes / bin_width), return_inverse=True)
+            keys.append(chunk_keys)
+            weights.append(np.bincount(pooled, weights=chunk_weights, minlength=len(chunk_keys)))
+            weighted_income.append(np.bincount(pooled, weights=chunk_weights * chunk_incomes, minlength=len(chunk_keys)))
+
+        # Pool the same bins across chunks
+        keys, pooled = np.unique(np.concatenate(keys), return_inverse=True)
+        weights = np.bincount(pooled, weights=np.concatenate(weights), minlength=len(keys))
+        weighted_income = np.bincount(pooled, weights=np.concatenate(weighted_income), minlength=len(keys))
+        occupied = weights > 0
+        weights, weighted_income = weights[occupied], weighted_income[occupied]
+        return cls(
+            incomes=weighted_income / weights,
+            cum_weights=np.concatenate([[0], np.cumsum(weights)]),
+            cum_income=np.concatenate([[0], np.cumsum(weighted_income)]),
+        )
+
+    @classmethod
+    def from_incomes(cls, incomes, weights=None, bin_width=1):
+        incomes = np.asarray(incomes, dtype=np.float64)
+        weights = np.ones(len(incomes)) if weights is None else np.asarray(weights, dtype=np.float64)
+        return cls.from_chunks([(incomes, weights)], bin_width)
+
+    @property
+    def adults(self):
+        return self.cum_weights[-1]
+
+    def net_cost(self, policy=DEFAULT_POLICY):
+        """Annual net cost of the policy: gross UBI outlay less clawback revenue.
+
+        The clawback is not rounded to the dollar here, which moves the total by at most
+        50 cents per adult compared with `microsimulation.simulate_population`.
+        """
+        below = np.searchsorted(self.incomes, policy.threshold_annual, side='left')
+        clawback_revenue = (policy.clawback_rate * self.cum_income[below]
+                            + policy.clawback_amount * (self.adults - self.cum_weights[below]))
+        return policy.annual_ubi * self.adults - clawback_revenue
+
+
+@dataclass
+class SolveResult:
+    parameter: str
+    value: float
+    policy: object
+    net_cost: float
+    target_cost: float
+    converged: bool  ## The net cost is within the solver's tolerance of the target
+    stopped: str  ## Why the search ended: 'tolerance', 'bracket', 'max_iterations', 'no_root', 'out_of_range' or 'nan'
+    iterations: int
+    evaluations: int
+    solve_time: float
+
+    @property
+    def residual(self):
+        return self.net_cost - self.target_cost
+
+
+def _find_root(f, guess, lower, upper, tolerance, xtolerance, max_iterations):
+    """Root of a continuous f in [lower, upper], starting the search around `guess`.
+
+    Brackets the root by stepping out from the guess, then narrows the bracket with the Illinois
+    variant of false position. Returns (x, f(x), converged, stopped, iterations, evaluations), where
+    converged means |f(x)| <= tolerance and stopped says why the search ended: 'tolerance',
+    'bracket' (narrowed below xtolerance, e.g. across a jump in f, without meeting the tolerance),
+    'max_iterations', 'no_root' (f has the same sign across [lower, upper]) or 'nan' (f gave NaN at
+    the x returned).
+    """
+    evaluations = 0
+
+    def count(x):
+        nonlocal evaluations
+        evaluations += 1
+        return float(f(x))
+
+    # Bracket the root, starting 1% either side of the guess and doubling the step
+    step = max(abs(guess) * 0.01, xtolerance)
+    lo, hi = max(lower, guess - step), min(upper, guess + step)
+    flo, fhi = count(lo), count(hi)
+    while flo * fhi > 0 and (lo > lower or hi < upper):
+        step *= 2
+        # Step out on the side nearer the root, unless that side is already at its bound
+        if lo > lower and (abs(flo) < abs(fhi) or hi >= upper):
+            lo = max(lower, lo - step)
+            flo = count(lo)
+        else:
+            hi = min(upper, hi + step)
+            fhi = count(hi)
+    # NaN compares false with everything, so it ends the stepping and would look like a bracket
+    if math.isnan(flo) or math.isnan(fhi):
+        x, fx = (lo, flo) if math.isnan(flo) else (hi, fhi)
+        return x, fx, False, 'nan', 0, evaluations
+    if flo * fhi > 0:
+        x, fx = (lo, flo) if abs(flo) < abs(fhi) else (hi, fhi)
+        return x, fx, abs(fx) <= tolerance, 'no_root', 0, evaluations
+
+    x, fx = (lo, flo) if abs(flo) < abs(fhi) else (hi, fhi)
+    side = 0
+    for iteration in range(1, max_iterations + 1):
+        if abs(fx) <= tolerance:
+            return x, fx, True, 'tolerance', iteration - 1, evaluations
+        if hi - lo <= xtolerance:
+            return x, fx, False, 'bracket', iteration - 1, evaluations
+        x = (lo * fhi - hi * flo) / (fhi - flo)
+        fx = count(x)
+        if math.isnan(fx):
+            return x, fx, False, 'nan', iteration, evaluations
+        if fx * fhi > 0:
+            hi, fhi = x, fx
+            if side == -1:
+                flo /= 2  # Halve the stale end point so the bracket closes from both sides
+            side = -1
+        else:
+            lo, flo = x, fx
+            if side == 1:
+                fhi /= 2
+            side = 1
+    return x, fx, abs(fx) <= tolerance, 'max_iterations', max_iterations, evaluations
+
+
+class PolicySolver:
+    """Solves for one policy setting against a fixed income histogram.
+
+    Each solve starts from the previous answer, so a UI control that nudges the target only
+    takes a few evaluations to re-solve.
+    """
+
+    def __init__(self, histogram, policy=DEFAULT_POLICY, tolerance=1.0, max_iterations=100):
+        self.histogram = histogram
+        self.policy = policy
+        self.tolerance = tolerance  ## Dollars of net cost
+        self.max_iterations = max_iterations
+        self._last_threshold = None
+
+    def solve_clawback_rate(self, target_cost, policy=None):
+        """Clawback rate that gives `target_cost` at the policy's UBI level and threshold.
+
+        The cost is linear in the rate, so this is solved exactly in one evaluation. A rate
+        outside 0-100% is reported as not converged.
+        """
+        policy = policy or self.policy
+        start = time.perf_counter()
+        hist = self.histogram
+        below = np.searchsorted(hist.incomes, policy.threshold_annual, side='left')
+        recovered_above = policy.clawback_amount * (hist.adults - hist.cum_weights[below])
+        income_below = hist.cum_income[below]
+        if income_below > 0:
+            rate = float((policy.annual_ubi * hist.adults - recovered_above - target_cost) / income_below)
+        else:
+            rate = policy.clawback_rate
+        solved = replace(policy, clawback_rate=rate)
+        net_cost = float(hist.net_cost(solved))
+        in_range = 0 <= rate <= 1
+        converged = abs(net_cost - target_cost) <= self.tolerance and in_range
+        if converged:
+            stopped = 'tolerance'
+        elif math.isnan(net_cost):
+            stopped = 'nan'
+        else:
+            stopped = 'out_of_range' if not in_range else 'no_root'
+        return SolveResult('clawback_rate', rate, solved, net_cost, target_cost,
+                           converged, stopped, 0, 1, time.perf_counter() - start)
+
+    def solve_threshold(self, target_cost, policy=None, link_rate=True, lower=1.0, upper=10_000_000.0):
+        """Threshold that gives `target_cost` at the policy's UBI level.
+
+        With `link_rate` the clawback rate follows the threshold (clawback amount / threshold), as
+        in the policy design, which makes the cost rise steadily with the threshold. Without it
+        the rate is held fixed and the cost need not be monotone, so the root found is the one
+        nearest the starting point.
+        """
+        policy = policy or self.policy
+        start = time.perf_counter()
+
+        def with_threshold(threshold):
+            if link_rate:
+                return replace(policy, threshold_annual=threshold, clawback_rate=policy.clawback_amount / threshold)
+            return replace(policy, threshold_annual=threshold)
+
+        guess = self._last_threshold or policy.threshold_annual
+        threshold, residual, converged, stopped, iterations, evaluations = _find_root(
+            lambda t: self.histogram.net_cost(with_threshold(t)) - target_cost,
+            guess, lower, upper, self.tolerance, 0.01, self.max_iterations)
+        # A bracket stop is as close as the cost curve gets, so it is still a good place to start from
+        if converged or stopped == 'bracket':
+            self._last_threshold = threshold
+        solved = with_threshold(threshold)
+        return SolveResult('threshold_annual', threshold, solved, target_cost + residual, target_cost,
+                           converged, stopped, iterations, evaluations, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve for the BIA clawback rate or threshold that meets a target net cost")
+    parser.add_argument('path', help="CSV or Parquet file with one row per adult (or per weighted group of adults)")
+    parser.add_argument('--income-col', default='income')
+    parser.add_argument('--weight-col', default=None)
+    parser.add_argument('--target-cost', type=float, required=True, help="annual net cost in dollars (0 for budget neutral)")
+    parser.add_argument('--solve', choices=['threshold', 'clawback_rate'], default='threshold')
+    parser.add_argument('--weekly-ubi', type=float, default=DEFAULT_POLICY.weekly_ubi_level,
+                        help="weekly UBI level; the whole annual UBI is recovered above the threshold")
+    parser.add_argument('--bin-width', type=float, default=1, help="histogram bin width in dollars")
+    parser.add_argument('--cache', action='store_true', help="read the file through the binary dataset cache (see dataset_cache.py)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    histogram = IncomeHistogram.from_chunks(read_chunks(args.path, args.income_col, args.weight_col, cache=args.cache),
+                                            args.bin_width)
+    print(f"Binned {histogram.adults:,.0f} adults into {len(histogram.incomes):,} bins in {time.perf_counter() - start:.2f}s")
+
+    policy = replace(DEFAULT_POLICY, weekly_ubi_level=args.weekly_ubi, clawback_amount=args.weekly_ubi * 52)
+    solver = PolicySolver(histogram, policy)
+    if args.solve == 'threshold':
+        result = solver.solve_threshold(args.target_cost)
+    else:
+        result = solver.solve_clawback_rate(args.target_cost)
+
+    print(f"Threshold:       ${result.policy.threshold_annual:,.2f}")
+    print(f"Clawback rate:   {result.policy.clawback_rate:.4%}")
+    print(f"Net cost:        ${result.net_cost:,.0f} (target ${result.target_cost:,.0f}, residual ${result.residual:,.2f})")
+    print(f"Converged:       {result.converged} (stopped on {result.stopped}) after {result.iterations} iterations, "
+          f"{result.evaluations} evaluations")
+    print(f"Solve time:      {result.solve_time * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+## Result and figure cache for the Streamlit app
+## Streamlit reruns app.py from the top on every keystroke. The caches here live at module level,
+## so they are shared by every session in the server process, and hold the work that does not
+## change between reruns: the policy chart model, the built figure, per-income results and the
+## income volatility scenarios.
+##############################################
+import threading
+from collections import OrderedDict
+
+from metrics import span
+from policy_chart import build_figure, chart_model, load_prebuilt_figure
+from policy_engine import DEFAULT_POLICY, calculate
+from scenarios import simulate_scenario
+##############################################
+
+
+class LRUCache:
+    """A thread-safe dictionary of at most `maxsize` entries that evicts the least recently used."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+        # Computed outside the lock so a slow build doesn't block other sessions' lookups.
+        # Two sessions missing the same key at once both compute it, and the second one wins
+        value = compute()
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+
+## The shared caches, keyed on the (frozen, hashable) policy parameters
+chart_models = LRUCache(maxsize=16)
+figures = LRUCache(maxsize=16)
+income_results = LRUCache(maxsize=10000)
+scenario_results = LRUCache(maxsize=256)
+
+
+def _chart_model(policy):
+    with span('chart_model'):
+        return chart_model(policy)
+
+
+def cached_chart_model(policy=DEFAULT_POLICY):
+    return chart_models.get_or_compute(policy, lambda: _chart_model(policy))
+
+
+def _figure(policy):
+    # Built at image build time where possible, which saves importing pandas and building it on the first run
+    with span('figure_load'):
+        prebuilt = load_prebuilt_figure(policy)
+    if prebuilt is not None:
+        return prebuilt
+    df = cached_chart_model(policy)
+    with span('figure_build'):
+        return build_figure(policy, df)
+
+
+def cached_figure(policy=DEFAULT_POLICY):
+    """The built policy overview figure. Callers must not modify it, as every session shares it."""
+    return figures.get_or_compute(policy, lambda: _figure(policy))
+
+
+def cached_income_results(pi, policy=DEFAULT_POLICY):
+    """`policy_engine.calculate` for one income. The dictionary is shared, so treat it as read-only."""
+    return income_results.get_or_compute((pi, policy), lambda: calculate(pi, policy))
+
+
+def _scenario_summary(scenario, policy):
+    with span('scenario'):
+        return simulate_scenario(scenario, policy=policy)
+
+
+def cached_scenario_summary(scenario, policy=DEFAULT_POLICY):
+    """`scenarios.simulate_scenario` for one scenario, run in this process with the default paths and seed."""
+    return scenario_results.get_or_compute((scenario, policy), lambda: _scenario_summary(scenario, policy))
+
+
+def cache_stats():
+    return {
+        'chart_models': chart_models.stats(),
+        'figures': figures.stats(),
+        'income_results': income_results.stats(),
+        'scenario_results': scenario_results.stats(),
+    }
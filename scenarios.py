@@ -0,0 +1,226 @@
+## BIA income volatility scenarios
+## The calculator gives one answer for a fixed annual income. Casual and gig workers' earnings go up
+## and down from week to week, and the UBI is recovered from each week's earnings, so the same average
+## income can leave them with more or less of the UBI. This draws many possible years of weekly
+## earnings for a person (spells without work, and hours that vary while working), runs them through
+## the weekly recovery and tax rules in weekly_simulation.py, and reports the expected net UBI
+## benefit and its spread.
+##
+## Runs are reproducible: paths are drawn in fixed-size blocks, each from its own child of one
+## np.random.SeedSequence, so a result depends only on the seed and not on how many worker
+## processes shared the blocks.
+##
+## Usage: python scenarios.py --income 45000 --weeks-without-work 6 --spell-weeks 3 --hours-variation 0.3
+##        python scenarios.py people.csv results.csv --paths 10000     (one row per person)
+##############################################
+import argparse
+import csv
+import math
+import time
+from dataclasses import dataclass, replace
+
+import numpy as np
+
+from policy_engine import DEFAULT_POLICY, calculate
+from weekly_simulation import simulate_paths
+##############################################
+
+WEEKS = 52
+DEFAULT_PATHS = 100_000
+DEFAULT_SEED = 0
+BLOCK_PATHS = 25_000  ## Paths drawn from one child seed; fixed so results don't depend on the worker count
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+@dataclass(frozen=True)
+class IncomeScenario:
+    """How one person's earnings vary over a year. Frozen so it can be used as a cache key."""
+    annual_income: float  ## Expected earnings over the year, with the weeks without work taken into account
+    weeks_without_work: float = 0  ## Expected number of weeks in the year with no earnings
+    spell_weeks: float = 4  ## Average length of a spell without work, in weeks
+    hours_variation: float = 0  ## Coefficient of variation of weekly earnings while working, e.g. 0.3 = 30%
+
+    def transition_probabilities(self):
+        """(chance of a spell starting in a working week, chance of it ending in a week without work).
+
+        Chosen so that, on average, `weeks_without_work` of the 52 weeks have no earnings.
+        """
+        if not 0 <= self.weeks_without_work < WEEKS:
+            raise ValueError(f"Weeks without work must be at least 0 and less than {WEEKS}")
+        if self.spell_weeks < 1:
+            raise ValueError("Spells without work must last at least a week on average")
+        if self.hours_variation < 0 or self.annual_income < 0:
+            raise ValueError("Income and hours variation can't be negative")
+        share = self.weeks_without_work / WEEKS
+        ending = 1 / self.spell_weeks
+        starting = share * ending / (1 - share)
+        if starting > 1:
+            raise ValueError("Spells without work are too short for that many weeks without work")
+        return starting, ending
+
+
+def draw_paths(scenario, paths, rng):
+    """A (paths x 52) float32 array of weekly earnings drawn for the scenario."""
+    starting, ending = scenario.transition_probabilities()
+    share = scenario.weeks_without_work / WEEKS
+    weekly_wage = scenario.annual_income / (WEEKS * (1 - share))
+
+    # Weeks with and without work follow a two-state chain, starting from its long-run mix
+    working = np.empty((paths, WEEKS), dtype=bool)
+    state = rng.random(paths) >= share
+    for week in range(WEEKS):
+        working[:, week] = state
+        draw = rng.random(paths, dtype=np.float32)
+        state = np.where(state, draw >= starting, draw < ending)
+
+    earnings = np.full((paths, WEEKS), weekly_wage, dtype=np.float32)
+    if scenario.hours_variation > 0:
+        # Gamma-distributed hours with a mean of 1 and the given coefficient of variation
+        shape = 1 / scenario.hours_variation ** 2
+        earnings *= rng.gamma(shape, 1 / shape, size=(paths, WEEKS)).astype(np.float32)
+    earnings *= working
+    return earnings
+
+
+def _simulate_block(seed, paths, scenario, policy):
+    """Per-path results for one block: annual income, net UBI (weekly and annual recovery), net final income."""
+    earnings = draw_paths(scenario, paths, np.random.default_rng(seed))
+    results = simulate_paths(earnings, policy, WEEKS)
+    return np.stack([
+        results['annual_income'],
+        policy.clawback_amount - results['period_clawback'],
+        policy.clawback_amount - results['annual_clawback'],
+        results['net_final_period'],
+    ])
+
+
+def _seed_blocks(seed, paths, block_paths=BLOCK_PATHS):
+    blocks = math.ceil(paths / block_paths)
+    children = np.random.SeedSequence(seed).spawn(blocks)
+    return [(child, min(block_paths, paths - k * block_paths)) for k, child in enumerate(children)]
+
+
+def summarise_paths(values, scenario, policy=DEFAULT_POLICY):
+    annual_income, net_ubi, net_ubi_annual, net_final = values
+    paths = len(net_ubi)
+    percentiles = np.percentile(net_ubi, PERCENTILES)
+    return {
+        'paths': paths,
+        'mean_income': float(annual_income.mean()),
+        'expected_net_ubi': float(net_ubi.mean()),  ## UBI kept with weekly recovery, the BIA design
+        'net_ubi_std': float(net_ubi.std()),
+        'net_ubi_standard_error': float(net_ubi.std() / math.sqrt(paths)),
+        **{f'net_ubi_p{p}': float(v) for p, v in zip(PERCENTILES, percentiles)},
+        'share_net_beneficiary': float((net_ubi > 0.5).mean()),
+        'expected_net_ubi_annual_recovery': float(net_ubi_annual.mean()),  ## If recovered from the year's income instead
+        'fixed_income_net_ubi': float(calculate(round(scenario.annual_income), policy)['net_ubi_benefit']),
+        'expected_net_final_income': float(net_final.mean()),
+        'net_final_income_std': float(net_final.std()),
+    }
+
+
+def simulate_scenario(scenario, paths=DEFAULT_PATHS, seed=DEFAULT_SEED, policy=DEFAULT_POLICY, workers=1):
+    """Draw `paths` years of weekly earnings for the scenario and summarise the net UBI benefit.
+
+    With more than one worker the blocks of paths go to a process pool; the result is the same.
+    """
+    # Imported here as microsimulation.py brings in pandas, which the app's first render doesn't need
+    from microsimulation import map_chunks
+    scenario.transition_probabilities()  # Check the settings before starting any workers
+    blocks = map_chunks(_simulate_block, _seed_blocks(seed, paths), (scenario, policy), workers)
+    return summarise_paths(np.concatenate(list(blocks), axis=1), scenario, policy)
+
+
+## Batch mode: one scenario per person
+BATCH_COLUMNS = ('annual_income', 'weeks_without_work', 'spell_weeks', 'hours_variation')
+BATCH_RESULT_KEYS = ('mean_income', 'expected_net_ubi', 'net_ubi_std', 'net_ubi_p5', 'net_ubi_p95',
+                     'share_net_beneficiary', 'fixed_income_net_ubi')
+
+
+def _simulate_people(first_row, scenarios, paths, seed, policy):
+    rows = []
+    for row, scenario in enumerate(scenarios, first_row):
+        # Each person's paths come from their own child seed, wherever they are processed
+        child = np.random.SeedSequence(seed, spawn_key=(row,))
+        values = _simulate_block(child, paths, scenario, policy)
+        rows.append(summarise_paths(values, scenario, policy))
+    return rows
+
+
+def read_scenarios(path, defaults=IncomeScenario(0)):
+    """Scenarios from a CSV with an annual_income (or income) column and optional
+    weeks_without_work, spell_weeks and hours_variation columns (blank cells use `defaults`)."""
+    scenarios = []
+    with open(path, newline='') as file:
+        for line in csv.DictReader(file):
+            values = {}
+            for column in BATCH_COLUMNS:
+                value = line.get(column, line.get('income') if column == 'annual_income' else None)
+                if value not in (None, ''):
+                    values[column] = float(value.replace(',', ''))
+            if 'annual_income' not in values:
+                raise ValueError(f"Row {len(scenarios) + 2} has no annual_income (or income)")
+            scenarios.append(replace(defaults, **values))
+    return scenarios
+
+
+def simulate_people(scenarios, paths=10_000, seed=DEFAULT_SEED, policy=DEFAULT_POLICY, workers=None, people_per_chunk=100):
+    """Summaries for many people, in order, `paths` draws each."""
+    from microsimulation import map_chunks
+    for scenario in scenarios:
+        scenario.transition_probabilities()
+    chunks = [(start, scenarios[start:start + people_per_chunk]) for start in range(0, len(scenarios), people_per_chunk)]
+    for rows in map_chunks(_simulate_people, chunks, (paths, seed, policy), workers):
+        yield from rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Expected net UBI benefit and its spread for incomes that vary from week to week")
+    parser.add_argument('source', nargs='?', help="CSV of people to run in batch mode (annual_income plus optional scenario columns)")
+    parser.add_argument('destination', nargs='?', help="CSV to write the batch results to")
+    parser.add_argument('--income', type=float, default=None, help="expected annual income, for a single scenario")
+    parser.add_argument('--weeks-without-work', type=float, default=0.0)
+    parser.add_argument('--spell-weeks', type=float, default=4.0)
+    parser.add_argument('--hours-variation', type=float, default=0.0, help="coefficient of variation of weekly earnings, e.g. 0.3")
+    parser.add_argument('--paths', type=int, default=None, help=f"paths per scenario (default {DEFAULT_PATHS:,}, or 10,000 per person in batch mode)")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU, 1 runs in-process)")
+    args = parser.parse_args()
+    defaults = IncomeScenario(args.income or 0, args.weeks_without_work, args.spell_weeks, args.hours_variation)
+
+    start = time.perf_counter()
+    if args.source:
+        if not args.destination:
+            parser.error("give a CSV to write the batch results to")
+        scenarios = read_scenarios(args.source, defaults)
+        with open(args.destination, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(BATCH_COLUMNS + BATCH_RESULT_KEYS)
+            for scenario, summary in zip(scenarios, simulate_people(scenarios, args.paths or 10_000, args.seed,
+                                                                    DEFAULT_POLICY, args.workers)):
+                writer.writerow([getattr(scenario, c) for c in BATCH_COLUMNS] + [round(summary[k], 2) for k in BATCH_RESULT_KEYS])
+        print(f"Wrote {len(scenarios):,} people to {args.destination} in {time.perf_counter() - start:.2f}s")
+        return
+
+    if args.income is None:
+        parser.error("give --income for a single scenario, or a CSV of people")
+    summary = simulate_scenario(defaults, args.paths or DEFAULT_PATHS, args.seed, DEFAULT_POLICY, args.workers)
+    elapsed = time.perf_counter() - start
+    lines = [
+        ("Paths", f"{summary['paths']:,}"),
+        ("Mean annual income", f"${summary['mean_income']:,.0f}"),
+        ("Expected net UBI (weekly recovery)", f"${summary['expected_net_ubi']:,.0f} (± ${summary['net_ubi_standard_error']:,.0f})"),
+        ("Spread of net UBI (std)", f"${summary['net_ubi_std']:,.0f}"),
+        ("Net UBI 5th / 50th / 95th percentile", f"${summary['net_ubi_p5']:,.0f} / ${summary['net_ubi_p50']:,.0f} / ${summary['net_ubi_p95']:,.0f}"),
+        ("Chance of keeping some UBI", f"{summary['share_net_beneficiary']:.1%}"),
+        ("Expected net UBI if recovered yearly", f"${summary['expected_net_ubi_annual_recovery']:,.0f}"),
+        ("Net UBI at a fixed income", f"${summary['fixed_income_net_ubi']:,.0f}"),
+        ("Expected net final income", f"${summary['expected_net_final_income']:,.0f} (std ${summary['net_final_income_std']:,.0f})"),
+    ]
+    for label, value in lines:
+        print(f"{label + ':':<40}{value}")
+    print(f"Simulated in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
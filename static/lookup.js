@@ -0,0 +1,74 @@
+// BIA calculator lookup for the static page
+// Evaluates the breakpoint artifact written by build_static.py (the tax brackets and the UBI
+// clawback settings) in the browser. Mirrors policy_engine.calculate operation for operation,
+// including Python's round-half-to-even, so the results match the Calculator page exactly.
+// build_static.py runs this file under Node to check that every dollar up to the artifact's
+// ceiling gives the same results as the Python functions.
+(function (root) {
+    'use strict';
+
+    // Python's round(x, 0): halves go to the even neighbour (Math.round sends them up)
+    function roundHalfEven(x) {
+        const r = Math.round(x);
+        return (r - x === 0.5 && r % 2 !== 0) ? r - 1 : r;
+    }
+
+    // Python's round(x, 1). toFixed rounds the exact binary value too, but sends ties up; a tie
+    // at one decimal place is only possible when x is an odd number of quarters
+    function roundOneDecimal(x) {
+        const quarters = x * 4;
+        if (Number.isInteger(quarters) && quarters % 2 !== 0) {
+            return roundHalfEven(x * 10) / 10;
+        }
+        return Number(x.toFixed(1));
+    }
+
+    function taxPayable(pi, taxBrackets) {
+        let tax = 0;
+        for (const [lower, rate, base] of taxBrackets) {
+            if (pi > lower) {
+                tax = base + (pi - lower) * rate;
+            }
+        }
+        return tax;
+    }
+
+    function clawback(pi, policy) {
+        return pi >= policy.threshold_annual ? policy.clawback_amount : roundHalfEven(pi * policy.clawback_rate);
+    }
+
+    // The same keys as policy_engine.calculate, plus the values the page's explainers show
+    function calculate(pi, artifact) {
+        const policy = artifact.policy;
+        const tax = taxPayable(pi, policy.tax_brackets);
+        const recovered = clawback(pi, policy);
+        const annualNetIncome = roundHalfEven(pi - tax);
+        const annualTaxPayable = roundHalfEven(tax);
+        const netUbiBenefit = policy.clawback_amount - recovered;
+        const netBenefit = annualNetIncome + netUbiBenefit;
+        return {
+            annual_tax_payable: annualTaxPayable,
+            weekly_tax_payable: roundHalfEven(tax / 52),
+            fortnightly_tax_payable: roundHalfEven(tax / 26),
+            annual_gross_income: roundHalfEven(pi),
+            weekly_gross_income: roundHalfEven(pi / 52),
+            fortnightly_gross_income: roundHalfEven(pi / 26),
+            annual_net_income: annualNetIncome,
+            weekly_net_income: roundHalfEven((pi - tax) / 52),
+            fortnightly_net_income: roundHalfEven((pi - tax) / 26),
+            clawback: recovered,
+            net_ubi_benefit: netUbiBenefit,
+            net_benefit: netBenefit,
+            tax_percent: roundOneDecimal((annualTaxPayable / Math.max(1, pi)) * 100),
+            net_gain: roundHalfEven(netBenefit - annualNetIncome),
+            above_threshold: pi >= policy.threshold_annual ? 1 : 0,
+        };
+    }
+
+    const api = { calculate, roundHalfEven, roundOneDecimal };
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = api;
+    } else {
+        root.BIALookup = api;
+    }
+})(this);
@@ -0,0 +1,157 @@
+## BIA pay-period simulation
+## The policy recovers the UBI "based on your week's earnings": any week under $1,550 ($80,600 / 52)
+## is a net beneficiary week. The calculator only models an annual total, which hides the difference
+## for people whose income goes up and down. This runs 52-week (or 26-fortnight) income paths for
+## many people at once, applying the clawback and PAYG-style withholding each pay period, and
+## compares the result with reconciling the same income once a year.
+##
+## Usage: python weekly_simulation.py paths.npy           (a people x periods array of earnings)
+##        python weekly_simulation.py --synthetic 1000000  (random paths, to check timing)
+##############################################
+import argparse
+import time
+
+import numpy as np
+
+from policy_engine import DEFAULT_POLICY, evaluate, tax_payable_array
+##############################################
+
+PERIODS_PER_YEAR = {'weekly': 52, 'fortnightly': 26}
+
+## People worked on at once. Keeps the float64 temporaries for a block to a few tens of MB
+DEFAULT_BLOCK_SIZE = 65536
+
+RESULT_KEYS = (
+    'annual_income',
+    'period_clawback',  ## UBI recovered pay period by pay period, summed over the year
+    'annual_clawback',  ## UBI recovered from the same income assessed once for the year
+    'withholding',  ## PAYG-style tax withheld each pay period, summed over the year
+    'annual_tax',  ## Tax assessed on the year's income
+    'net_final_period',  ## Net final income when the UBI is reconciled each pay period
+    'net_final_annual',  ## Net final income when the UBI is reconciled once a year
+)
+
+
+def period_clawback(earnings, policy=DEFAULT_POLICY, periods_per_year=52):
+    """UBI recovered in each pay period: the annual rule scaled to one period's threshold and UBI.
+
+    Works in float32 and is not rounded to the dollar, unlike the annual `clawback`.
+    """
+    earnings = np.asarray(earnings, dtype=np.float32)
+    period_threshold = np.float32(policy.threshold_annual / periods_per_year)
+    period_amount = np.float32(policy.clawback_amount / periods_per_year)
+    return np.where(earnings >= period_threshold, period_amount, earnings * np.float32(policy.clawback_rate))
+
+
+def payg_withholding(earnings, policy=DEFAULT_POLICY, periods_per_year=52):
+    """Tax withheld from one pay period's earnings, by annualising them as the ATO schedules do."""
+    annualised = np.asarray(earnings, dtype=np.float64) * periods_per_year
+    return (tax_payable_array(annualised, policy.tax_brackets) / periods_per_year).astype(np.float32)
+
+
+def simulate_paths(earnings, policy=DEFAULT_POLICY, periods_per_year=52, block_size=DEFAULT_BLOCK_SIZE):
+    """Run a (people x pay periods) array of earnings through the policy both ways.
+
+    Returns a dictionary of float32 arrays, one value per person (see RESULT_KEYS), plus
+    'net_beneficiary_periods', the number of pay periods in which each person kept some UBI.
+    """
+    # Not converted up front: a memory-mapped float64 file is read a block at a time
+    earnings = np.asanyarray(earnings)
+    if earnings.ndim != 2 or earnings.shape[1] != periods_per_year:
+        raise ValueError(f"Expected a (people, {periods_per_year}) array of earnings, got shape {earnings.shape}")
+
+    people = len(earnings)
+    results = {key: np.empty(people, dtype=np.float32) for key in RESULT_KEYS}
+    results['net_beneficiary_periods'] = np.empty(people, dtype=np.uint8)
+    period_amount = np.float32(policy.clawback_amount / periods_per_year)
+
+    for start in range(0, people, block_size):
+        block = np.asarray(earnings[start:start + block_size], dtype=np.float32)
+        rows = slice(start, start + len(block))
+
+        recovered = period_clawback(block, policy, periods_per_year)
+        results['period_clawback'][rows] = recovered.sum(axis=1, dtype=np.float64)
+        results['net_beneficiary_periods'][rows] = np.count_nonzero(recovered < period_amount, axis=1)
+        results['withholding'][rows] = payg_withholding(block, policy, periods_per_year).sum(axis=1, dtype=np.float64)
+
+        annual_income = block.sum(axis=1, dtype=np.float64)
+        annual = evaluate(annual_income, policy)
+        results['annual_income'][rows] = annual_income
+        results['annual_clawback'][rows] = annual['clawback']
+        results['annual_tax'][rows] = annual['tax']
+        net_earned_income = annual['net_earned_income']
+        results['net_final_period'][rows] = net_earned_income + policy.clawback_amount - results['period_clawback'][rows]
+        results['net_final_annual'][rows] = annual['net_final_income']
+    return results
+
+
+def summarise(results, weights=None):
+    """Weighted averages comparing pay-period reconciliation with annual reconciliation."""
+    people = len(results['annual_income'])
+    weights = np.ones(people) if weights is None else np.asarray(weights, dtype=np.float64)
+    total = weights.sum()
+    gain = results['net_final_period'].astype(np.float64) - results['net_final_annual']
+    tax_due = results['annual_tax'].astype(np.float64) - results['withholding']
+
+    def mean(values):
+        return float(np.dot(values, weights) / total)
+
+    return {
+        'people': people,
+        'mean_annual_income': mean(results['annual_income']),
+        'mean_period_clawback': mean(results['period_clawback']),
+        'mean_annual_clawback': mean(results['annual_clawback']),
+        'mean_gain_from_period_reconciliation': mean(gain),
+        'share_better_off_by_period': mean(gain > 0.5),
+        'share_worse_off_by_period': mean(gain < -0.5),
+        'mean_tax_due_at_reconciliation': mean(tax_due),
+        'mean_net_beneficiary_periods': mean(results['net_beneficiary_periods']),
+    }
+
+
+def synthetic_paths(people, periods_per_year=52, seed=0):
+    """Random earnings paths for testing: a steady wage with some weeks lost to unemployment."""
+    rng = np.random.default_rng(seed)
+    wage = rng.lognormal(np.log(1400 * 52 / periods_per_year), 0.6, size=(people, 1)).astype(np.float32)
+    hours = rng.gamma(8.0, 1 / 8.0, size=(people, periods_per_year)).astype(np.float32)
+    working = rng.random((people, periods_per_year), dtype=np.float32) > np.float32(0.08)
+    return wage * hours * working
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pay-period and annual reconciliation of the BIA clawback")
+    parser.add_argument('path', nargs='?', help=".npy file holding a (people x periods) array of earnings")
+    parser.add_argument('--synthetic', type=int, default=None, help="simulate this many random people instead")
+    parser.add_argument('--period', choices=sorted(PERIODS_PER_YEAR), default='weekly')
+    args = parser.parse_args()
+    periods_per_year = PERIODS_PER_YEAR[args.period]
+
+    if args.synthetic:
+        earnings = synthetic_paths(args.synthetic, periods_per_year)
+    elif args.path:
+        earnings = np.load(args.path, mmap_mode='r')
+    else:
+        parser.error("give a .npy file of earnings or --synthetic N")
+
+    start = time.perf_counter()
+    results = simulate_paths(earnings, DEFAULT_POLICY, periods_per_year)
+    elapsed = time.perf_counter() - start
+
+    summary = summarise(results)
+    period = args.period
+    lines = [
+        ("People", f"{summary['people']:,}"),
+        ("Mean annual income", f"${summary['mean_annual_income']:,.0f}"),
+        (f"Mean UBI recovered ({period})", f"${summary['mean_period_clawback']:,.0f}"),
+        ("Mean UBI recovered (annual)", f"${summary['mean_annual_clawback']:,.0f}"),
+        (f"Mean gain from {period} reconciliation", f"${summary['mean_gain_from_period_reconciliation']:,.0f}"),
+        ("Better off / worse off", f"{summary['share_better_off_by_period']:.1%} / {summary['share_worse_off_by_period']:.1%}"),
+        ("Mean tax due at reconciliation", f"${summary['mean_tax_due_at_reconciliation']:,.0f}"),
+        (f"Mean {period} periods as a net beneficiary", f"{summary['mean_net_beneficiary_periods']:.1f}"),
+    ]
+    for label, value in lines:
+        print(f"{label + ':':<48}{value}")
+    print(f"Simulated in {elapsed:.2f}s")
+
+if __name__ == '__main__':
+    main()